@@ -1,13 +1,17 @@
 #!/usr/bin/python3
 
 from os import environ
-from signal import signal, SIGINT
+from signal import signal, SIGINT, SIGTERM
 from datetime import datetime
+from sys import stderr, stdout
 
 import modules.base as base
 from modules.db import DatabaseConn
 from modules.logger import Logger
-from modules.rundeck import RundeckApi
+from modules.metrics import Metrics
+
+# Every other module (and with them requests, urllib3, MySQL connector or aiohttp) is
+# only imported by the modes which need it, to keep startup of each scheduled run short
 
 
 if __name__ == '__main__':
@@ -18,11 +22,14 @@ if __name__ == '__main__':
     # Parse configuration file w/ mandatory parameters to the script
     CONF = base.parse_args('Rundeck manager - listing and maintenance of executions data')
     # Initialization of class objects
-    LOG = Logger(level=1) if CONF.debug else Logger()
+    # Keep logs apart from executions exported to stdout
+    LOG_STREAM = stderr if CONF.execution_mode == 'inventory' and CONF.output_file == '-' else stdout
+    LOG = Logger(level=1 if CONF.debug else 2, stream=LOG_STREAM)
 
     # Validate configuration parameters
-    if not base.validate_configs(CONF):
-        LOG.write('Error on passed parameters. Exiting without success...', 5)
+    VALID, ERR_MSG = base.validate_configs(CONF)
+    if not VALID:
+        LOG.write('Error on passed parameters: {0} Exiting without success...'.format(ERR_MSG), 5)
         exit(1)
 
     # Set up global variables
@@ -49,21 +56,155 @@ if __name__ == '__main__':
         'Accept': 'application/json'
     }
 
-    DB_CONN = DatabaseConn(DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT)
-    RDECK = RundeckApi(URL, HEADERS, DB_CONN, LOG, CONF.chunk_size, CONF.keep_time,
-                       CONF.ssl_enabled, CONF.search_timeout, CONF.delete_timeout)
+    # Database is only connected to on its first query
+    DB_CONN = DatabaseConn(DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT, CONF.db_pool_size)
+    METRICS = Metrics()
+    RDECK = None
+    CATALOG = None
+    ARCHIVE = None
+    THROTTLE = None
+
+    # Leave before setting anything else up when there is nothing old enough to delete
+    if CONF.probe:
+        from mysql.connector import Error
+
+        try:
+            PENDING = DB_CONN.has_old_executions(base.get_cutoff_date(CONF.keep_time), CONF.filtered_project)
+        except Error as err:
+            PENDING = True
+            LOG.write('Error probing old executions, running anyway: {0}'.format(err), 3)
+
+        if not PENDING:
+            LOG.write('No executions older than {0} found. Nothing to do.'.format(CONF.keep_time))
+            DB_CONN.close()
+            exit(0)
+
+    if CONF.execution_mode in ['daemon', 'plan', 'inventory'] or \
+            (CONF.execution_mode in ['cleanup', 'listing'] and not CONF.async_client):
+        from modules.adaptive import ChunkController
+        from modules.archive import ExecutionsArchive
+        from modules.catalog import Catalog
+        from modules.journal import Journal
+        from modules.retry import RetryPolicy
+        from modules.rundeck import RundeckApi
+
+        CHUNKER = ChunkController(CONF.chunk_size, CONF.adaptive_chunk, CONF.target_latency,
+                                  CONF.max_chunk_size)
+        JOURNAL = Journal(CONF.journal, CONF.resume) if CONF.execution_mode == 'cleanup' and CONF.journal else None
+        CATALOG = Catalog(CONF.catalog, URL, CONF.catalog_ttl, CONF.refresh_catalog) if CONF.catalog else None
+        ARCHIVE = ExecutionsArchive(CONF.archive_dir, CONF.archive_max_size * 1024 * 1024) \
+            if CONF.archive_dir else None
+        RETRY = RetryPolicy(CONF.retry_budget, CONF.max_retry_delay, CONF.breaker_threshold,
+                            CONF.breaker_cooldown)
+
+        if CONF.throttle and CONF.execution_mode in ['cleanup', 'daemon']:
+            from modules.throttle import LoadThrottle
+
+            REPLICA_CONN = DatabaseConn(DB_NAME, DB_USER, DB_PASS, CONF.replica_host, DB_PORT) \
+                if CONF.replica_host else None
+            THROTTLE = LoadThrottle(DB_CONN.clone(), LOG, REPLICA_CONN, CONF.max_threads_running,
+                                    CONF.max_history_length, CONF.max_replica_lag, CONF.max_api_latency,
+                                    CONF.max_error_rate, max_pause=CONF.throttle_max_pause, metrics=METRICS)
+
+        RDECK = RundeckApi(URL, HEADERS, DB_CONN, LOG, CONF.chunk_size, CONF.keep_time,
+                           CONF.ssl_enabled, CONF.search_timeout, CONF.delete_timeout,
+                           CONF.pool_size, CONF.keep_alive, CONF.http_retries, CONF.prefetch, CHUNKER,
+                           JOURNAL, METRICS, THROTTLE, CATALOG, ARCHIVE, RETRY)
+
+    if CONF.async_client:
+        from modules.async_rundeck import AsyncRundeckApi
+
+        ARDECK = AsyncRundeckApi(URL, HEADERS, DB_CONN, LOG, CONF.chunk_size, CONF.keep_time,
+                                 CONF.ssl_enabled, CONF.search_timeout, CONF.delete_timeout,
+                                 CONF.concurrency)
 
     # Start execution from available modes
-    if CONF.execution_mode == 'cleanup':
+    if CONF.execution_mode == 'cleanup' and CONF.async_client:
+        STATUS, MSG = ARDECK.run('clean_executions', CONF.filtered_project, CONF.retries,
+                                 CONF.retry_delay, CONF.unoptimized)
+        HOUR, MIN, SEC = base.get_formatted_time(datetime.now() - START)
+        LOG.write("Cleanup time: {0}h, {1}min and {2}sec".format(HOUR, MIN, SEC))
+    elif CONF.execution_mode == 'cleanup':
         STATUS, MSG = RDECK.clean_executions(CONF.filtered_project, CONF.executions_by_project,
-                                             CONF.retries, CONF.retry_delay, CONF.unoptimized)
+                                             CONF.retries, CONF.retry_delay, CONF.unoptimized,
+                                             CONF.workers, CONF.db_prescan)
         HOUR, MIN, SEC = base.get_formatted_time(datetime.now() - START)
         LOG.write("Cleanup time: {0}h, {1}min and {2}sec".format(HOUR, MIN, SEC))
+    elif CONF.execution_mode == 'daemon':
+        from modules.daemon import CleanupDaemon
+
+        DAEMON = CleanupDaemon(RDECK, LOG, METRICS, CONF.daemon_state, CONF.keep_time, CONF.daemon_interval,
+                               CONF.pass_max_time, CONF.pass_max_rows, CONF.metrics_prom, CONF.metrics_json)
+        signal(SIGTERM, lambda signum, frame: DAEMON.stop())
+        STATUS, MSG = DAEMON.run(CONF.filtered_project, CONF.retries, CONF.retry_delay, CONF.unoptimized)
+    elif CONF.execution_mode == 'db-purge':
+        from modules.purge import DatabasePurge
+
+        PURGE = DatabasePurge(DB_CONN, LOG, CONF.keep_time, CONF.purge_batch_size,
+                              CONF.purge_throttle, CONF.logs_dir)
+        STATUS, MSG = PURGE.purge(CONF.filtered_project)
+        if not STATUS:
+            LOG.write(MSG, 4)
+        HOUR, MIN, SEC = base.get_formatted_time(datetime.now() - START)
+        LOG.write("Purge time: {0}h, {1}min and {2}sec".format(HOUR, MIN, SEC))
+    elif CONF.execution_mode == 'reconcile':
+        from modules.purge import DatabasePurge
+
+        PURGE = DatabasePurge(DB_CONN, LOG, CONF.keep_time, CONF.purge_batch_size, CONF.purge_throttle)
+        STATUS, MSG = PURGE.reconcile()
+        if not STATUS:
+            LOG.write(MSG, 4)
+        HOUR, MIN, SEC = base.get_formatted_time(datetime.now() - START)
+        LOG.write("Reconcile time: {0}h, {1}min and {2}sec".format(HOUR, MIN, SEC))
+    elif CONF.execution_mode == 'reap-logs':
+        from modules.reaper import LogReaper
+
+        REAPER = LogReaper(DB_CONN, LOG, CONF.logs_dir, CONF.keep_time, CONF.purge_batch_size,
+                           CONF.workers, CONF.reap_expired)
+        STATUS, MSG = REAPER.reap()
+        if not STATUS:
+            LOG.write(MSG, 4)
+        HOUR, MIN, SEC = base.get_formatted_time(datetime.now() - START)
+        LOG.write("Reap time: {0}h, {1}min and {2}sec".format(HOUR, MIN, SEC))
+    elif CONF.execution_mode == 'plan':
+        from modules.planner import CleanupPlanner
+
+        PLANNER = CleanupPlanner(RDECK, DB_CONN, LOG, CONF.chunk_size, CONF.keep_time,
+                                 CONF.workers, CONF.plan_delete_latency)
+        STATUS, MSG = PLANNER.plan(CONF.filtered_project, CONF.executions_by_project)
+        if not STATUS:
+            LOG.write(MSG, 4)
+    elif CONF.execution_mode == 'inventory':
+        from modules.export import ExecutionsWriter
+
+        WRITER = ExecutionsWriter(CONF.output_file, CONF.output_format)
+        STATUS, MSG = RDECK.export_executions(WRITER, CONF.filtered_project, CONF.filtered_job)
+        WRITER.close()
+        if not STATUS:
+            LOG.write(MSG, 4)
+    elif CONF.execution_mode == 'listing' and CONF.async_client:
+        STATUS, MSG = ARDECK.run('list_executions', CONF.filtered_project, CONF.filtered_job, CONF.running)
     elif CONF.execution_mode == 'listing':
         STATUS, MSG = RDECK.list_executions(CONF.filtered_project, CONF.filtered_job, CONF.running)
     else:
+        STATUS, MSG = False, ''
         LOG.write('No execution mode matching {0}'.format(CONF.execution_mode), 3)
 
+    if CONF.metrics_prom:
+        METRICS.write_prometheus(CONF.metrics_prom)
+    if CONF.metrics_json:
+        METRICS.write_json(CONF.metrics_json)
+
+    if RDECK:
+        RDECK.close()
+    if ARCHIVE:
+        ARCHIVE.close()
+    if CATALOG:
+        CATALOG.close()
+    if THROTTLE:
+        THROTTLE.close()
+    DB_CONN.close()
+
     if not STATUS:
         LOG.write('Exiting without success...', 4)
 
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+
+import threading
+
+
+class ChunkController(object):
+    '''
+    This class decides how many executions are deleted in each chunk.
+
+    When adaptive, the chunk grows while deleting it takes less than a target latency
+    and is halved as soon as a delete times out, fails or takes too long (AIMD), so it
+    settles on the largest size Rundeck and its database cope with. Otherwise it
+    always returns the configured size, only keeping statistics.
+    '''
+
+    def __init__(self, size=200, adaptive=False, target=10.0, max_size=2000, min_size=10, growth=1.25):
+        '''Initialization of global variables'''
+        self._size = size
+        self._adaptive = adaptive
+        self._target = target
+        self._max_size = max(max_size, size)
+        self._min_size = min(min_size, size)
+        self._growth = growth
+        self._lock = threading.Lock()
+        self._n_chunks = 0
+        self._n_executions = 0
+        self._n_backoffs = 0
+        self._sizes = [size, size]
+
+    @property
+    def size(self):
+        '''Current chunk size'''
+        return self._size
+
+    def update(self, n_executions, latency, success=True):
+        '''Account a deleted chunk and adjust the size of the next ones'''
+        with self._lock:
+            self._n_chunks += 1
+            self._n_executions += n_executions
+
+            if not self._adaptive:
+                return
+
+            if not success or latency > self._target:
+                self._size = max(self._min_size, self._size // 2)
+                self._n_backoffs += 1
+            elif n_executions >= self._size and latency < self._target / 2:
+                # Only grow when the chunk was full, a short last page says nothing about latency
+                self._size = min(self._max_size, int(self._size * self._growth) + 1)
+
+            self._sizes = [min(self._sizes[0], self._size), max(self._sizes[1], self._size)]
+
+    def summary(self):
+        '''Return a description of the chosen chunk sizes'''
+        with self._lock:
+            average = self._n_executions / float(self._n_chunks) if self._n_chunks else 0
+
+            return 'Chunk statistics: {0} chunks of {1:.1f} executions on average (min size {2}, ' \
+                   'max size {3}, last size {4}, {5} backoffs).'.format(
+                       self._n_chunks, average, self._sizes[0], self._sizes[1], self._size, self._n_backoffs)
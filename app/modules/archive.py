@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+import threading
+
+from gzip import compress
+from json import dumps
+from os import fsync, path
+from time import strftime
+
+
+class ExecutionsArchive(object):
+    '''
+    This class keeps a record of every execution deleted, in gzipped NDJSON files of
+    an archive directory, which are only ever appended to.
+
+    Each chunk is compressed on its own and appended as a separate gzip member, so
+    an archive file is always readable (e.g. with zcat) up to the last chunk written,
+    even if the process dies halfway. Once a file grows over max_size bytes, records
+    go to a new one.
+    '''
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024):
+        '''Initialization of global variables'''
+        self._directory = directory
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._prefix = 'executions-{0}'.format(strftime('%Y%m%dT%H%M%S'))
+        self._index = 0
+        self._file = None
+        self._count = 0
+
+    @property
+    def count(self):
+        '''Number of records archived so far'''
+        return self._count
+
+    def __open(self):
+        '''Open the next archive file of this run'''
+        self._index += 1
+        file_path = path.join(self._directory, '{0}-{1:03d}.ndjson.gz'.format(self._prefix, self._index))
+        self._file = open(file_path, 'ab')
+
+    def write(self, records):
+        '''Append records to the archive, returning once they are on disk'''
+        if not records:
+            return
+
+        lines = ''.join(dumps(record, separators=(',', ':'), default=str) + '\n' for record in records)
+        data = compress(lines.encode('utf-8'))
+
+        with self._lock:
+            if self._file and self._file.tell() >= self._max_size:
+                self._file.close()
+                self._file = None
+            if self._file is None:
+                self.__open()
+
+            self._file.write(data)
+            self._file.flush()
+            fsync(self._file.fileno())
+            self._count += len(records)
+
+    def close(self):
+        '''Close the current archive file'''
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
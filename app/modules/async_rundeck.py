@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+
+import asyncio
+
+from collections import OrderedDict
+from time import time
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from .ids import IdBatch, get_failed_executions
+
+
+def parse_json_data(res, filter_by='', appender=''):
+    '''Same filtering of RundeckApi.parse_json_response, over already decoded JSON'''
+    res = res[filter_by] if filter_by else res
+
+    if isinstance(res, list):
+        return [data[appender] if appender else data for data in res]
+
+    return res[appender] if appender else res
+
+
+class AsyncRundeckApi(object):
+    '''
+    This class provides the same operations of RundeckApi on top of asyncio, so requests
+    for many projects or jobs are in flight at the same time instead of one after another.
+
+    The number of concurrent requests is bounded by a semaphore. Database operations are
+    blocking, so they run in the default executor and are serialized, as they share a
+    single connection.
+    '''
+
+    def __init__(self, url, headers, db_conn, log, chunk_size=200, keep_time='30d', ssl=False, search_time=60,
+                 del_time=300, concurrency=20):
+        '''Initialization of global variables'''
+        self._url = url
+        self._headers = headers
+        self._db = db_conn
+        self._log = log
+        self._chunk_size = chunk_size
+        self._keep_time = keep_time
+        self._check_ssl = ssl
+        self._search_time = search_time
+        self._del_time = del_time
+        self._concurrency = concurrency
+        self._session = None
+        self._semaphore = None
+        self._db_lock = None
+
+    async def __aenter__(self):
+        '''Open the HTTP session, which must be created inside a running event loop'''
+        connector = TCPConnector(limit=self._concurrency, ssl=None if self._check_ssl else False)
+        self._session = ClientSession(headers=self._headers, connector=connector)
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._db_lock = asyncio.Lock()
+
+        return self
+
+    async def __aexit__(self, *args):
+        '''Release all pooled HTTP connections'''
+        await self._session.close()
+
+    def run(self, method, *args):
+        '''Run one of the coroutines of this client until it completes, returning its result'''
+        async def runner():
+            async with self:
+                return await getattr(self, method)(*args)
+
+        return asyncio.run(runner())
+
+    async def __request(self, method, endpoint, parameters=None, data=None, timeout=60):
+        '''Requests in Rundeck API endpoints, returning the decoded JSON body'''
+        if not endpoint:
+            return False, 'No valid endpoint.'
+
+        if parameters:
+            parameters = dict((key, str(value)) for key, value in parameters.items())
+
+        try:
+            async with self._semaphore:
+                async with self._session.request(method, endpoint, params=parameters, data=data,
+                                                 timeout=ClientTimeout(total=timeout)) as response:
+                    if response.status >= 400:
+                        return False, 'Failing accessing API endpoint with http code: {0}'.format(
+                            response.status)
+
+                    return True, await response.json(content_type=None)
+        except (ClientError, asyncio.TimeoutError, ValueError) as exception:
+            return False, exception
+
+    async def __get(self, endpoint, parameters=None):
+        '''GET requests in Rundeck API endpoints'''
+        return await self.__request('GET', endpoint, parameters, timeout=self._search_time)
+
+    async def __post(self, endpoint, parameters=''):
+        '''POST requests in Rundeck API endpoints'''
+        return await self.__request('POST', endpoint, data=parameters, timeout=self._del_time)
+
+    async def __db(self, function, *args):
+        '''Run a blocking database operation without stalling the event loop'''
+        async with self._db_lock:
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def get_projects(self, only_names=True):
+        '''Retrieve info about existing projects'''
+        endpoint = '{0}/projects'.format(self._url)
+        status, response = await self.__get(endpoint)
+
+        if not status:
+            return False, response
+
+        return True, parse_json_data(response, None, 'name' if only_names else '')
+
+    async def get_jobs_by_project(self, project_name, only_ids=True):
+        '''Retrieve info about all jobs by project'''
+        endpoint = '{0}/project/{1}/jobs'.format(self._url, project_name)
+        status, response = await self.__get(endpoint)
+
+        if not status:
+            return False, response
+
+        return True, parse_json_data(response, None, 'id' if only_ids else '')
+
+    async def get_executions(self, identifier, page, jobs=True, only_ids=True, running=False, size=None):
+        '''Get executions older than a given number of days by job or project'''
+        search_type = 'job' if jobs else 'project'
+        endpoint = '{0}/{1}/{2}/executions'.format(self._url, search_type, identifier)
+        size = size if size else self._chunk_size
+
+        if jobs:
+            parameters = {
+                'max': size,
+                'offset': page * self._chunk_size,
+            }
+        else:
+            parameters = {
+                'max': size,
+                'olderFilter': str(self._keep_time)
+            }
+
+        if running:
+            endpoint = '{0}/running'.format(endpoint)
+
+        status, response = await self.__get(endpoint, parameters)
+
+        if not status:
+            return False, response
+
+        return True, parse_json_data(response, 'executions', 'id' if only_ids else '')
+
+    async def get_total_executions(self, identifier, jobs=True):
+        '''Get executions counter by project or job'''
+        search_type = 'job' if jobs else 'project'
+        endpoint = '{0}/{1}/{2}/executions'.format(self._url, search_type, identifier)
+        parameters = {
+            'olderFilter': str(self._keep_time),
+            'max': 1
+        }
+
+        status, response = await self.__get(endpoint, parameters)
+
+        if not status:
+            return False, response
+
+        return True, parse_json_data(response, 'paging', 'total')
+
+    async def delete_executions(self, executions_ids):
+        '''Bulk deletions of Rundeck executions, returning which of them could not be deleted'''
+        endpoint = '{0}/executions/delete'.format(self._url)
+        executions_ids = IdBatch.of(executions_ids)
+        status, response = await self.__post(endpoint, executions_ids.to_json())
+
+        if not status:
+            return False, executions_ids
+
+        return get_failed_executions(executions_ids, response)
+
+    async def __delete_executions_data(self, identifier, executions, offset, retries=5, backoff=5,
+                                       unoptimized=False):
+        '''
+        Private function to delete both executions and workflows. As in RundeckApi, workflows
+        are looked up once, before any execution is gone, and each retry only covers
+        executions which Rundeck failed to delete, and workflows whose deletion failed
+        '''
+        from mysql.connector import Error
+
+        executions = IdBatch.of(executions)
+        msg = '[{0}]: Deleting range {1} to {2}'.format(identifier, offset, offset + len(executions))
+        self._log.write(msg)
+
+        try:
+            mapping = await self.__db(self._db.get_workflows_by_execution, executions)
+        except Error as err:
+            return False, '[{0}]: Error looking up workflows: {1}'.format(identifier, err)
+
+        if not mapping:
+            return False, '[{0}]: No workflows found for executions.'.format(identifier)
+
+        pending = executions
+        orphans = IdBatch()
+
+        for attempt in range(1, retries + 1):
+            if pending:
+                _, failed = await self.delete_executions(pending)
+                failed = set(failed)
+                orphans.extend(IdBatch(exec_id for exec_id in pending if exec_id not in failed))
+                pending = IdBatch(exec_id for exec_id in pending if exec_id in failed)
+
+            # Workflows can only go once their executions are gone
+            if orphans:
+                workflows = IdBatch(OrderedDict((mapping[exec_id][0], None) for exec_id in orphans
+                                                if exec_id in mapping))
+                steps = IdBatch(step for exec_id in orphans if exec_id in mapping for step in mapping[exec_id][1])
+
+                try:
+                    await self.__db(self._db.delete_workflows, workflows, steps, unoptimized)
+                    orphans = IdBatch()
+                except Error as err:
+                    await self.__db(self._db.rollback)
+                    msg = '[{0}]: Error deleting workflows: {1}'.format(identifier, err)
+                    self._log.write(msg, 3)
+
+            if not pending and not orphans:
+                return True, ''
+
+            if attempt < retries:
+                msg = '[{0}] #{1} try not succeeded ({2} executions and workflows of {3} executions left). ' \
+                      'Trying again in {4} seconds.'.format(identifier, attempt, len(pending), len(orphans), backoff)
+                self._log.write(msg, 1)
+                await asyncio.sleep(backoff)
+
+        return False, '[{0}]: Error deleting {1} executions and workflows of {2} executions.'.format(
+            identifier, len(pending), len(orphans))
+
+    async def clean_project_executions(self, project, retries=5, backoff=5, unoptimized=False):
+        '''Clean executions older than a given time by from a project'''
+        status, total = await self.get_total_executions(project, False)
+
+        if not status:
+            return False, "[{0}]: Error returning executions counter.".format(project)
+
+        msg = "[{0}]: There are {1} executions to delete.".format(project, total)
+        self._log.write(msg)
+        offset = 0
+
+        while offset < total:
+            status, executions = await self.get_executions(project, 0, False)
+
+            if not status:
+                return False, '[{0}]: Error getting executions.'.format(project)
+            elif not executions:
+                break
+
+            status, msg = await self.__delete_executions_data(project, executions, offset, retries,
+                                                              backoff, unoptimized)
+            if not status:
+                return False, msg
+
+            offset += len(executions)
+
+        return True, total
+
+    async def clean_executions(self, project=None, retries=5, backoff=5, unoptimized=False):
+        '''Clean all executions data older than a given time, all projects at once'''
+        start = time()
+
+        if project:
+            status, projects = True, [project]
+        else:
+            status, projects = await self.get_projects()
+
+        if not status:
+            return status, projects
+
+        # A project failing, even on an unexpected exception, must not abort the others
+        results = await asyncio.gather(*[
+            self.clean_project_executions(proj, retries, backoff, unoptimized) for proj in projects],
+            return_exceptions=True)
+        stats_total = 0
+        error = ''
+
+        for proj, result in zip(projects, results):
+            if isinstance(result, Exception):
+                result = False, '[{0}]: Error cleaning executions: {1}'.format(proj, result)
+
+            status, data = result
+
+            if not status:
+                self._log.write(data, 4)
+                error = error or data
+                continue
+
+            msg = '[{0}] statistics: {1} old executions deleted.'.format(proj, int(data))
+            self._log.write(msg)
+            stats_total += int(data)
+
+        msg = 'Global statistics: {0} old executions deleted ({1:.1f} executions/sec).'.format(
+            stats_total, stats_total / max(time() - start, 1e-3))
+        self._log.write(msg)
+
+        return (False, error) if error else (True, '')
+
+    async def list_executions(self, project=None, job=None, only_running=False):
+        '''List executions by job/project, querying all of them at once'''
+        if job:
+            status, data = True, [job]
+        elif project:
+            status, data = True, [project]
+        else:
+            status, data = await self.get_projects()
+
+        if not status:
+            return False, data
+
+        results = await asyncio.gather(*[
+            self.get_executions(row, 0, bool(job), False, only_running) for row in data])
+
+        for row, (status, executions) in zip(data, results):
+            if not status:
+                return False, '[{0}] Error getting executions.'.format(row)
+
+            for ex in executions:
+                msg = '[{0}] - \'{1}\' is {2}'.format(ex['project'], ex.get('job', {}).get('name'), ex['status'])
+                self._log.write(msg)
+
+        return True, ''
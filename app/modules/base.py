@@ -1,7 +1,16 @@
 #!/usr/bin/python3
 
 from argparse import ArgumentParser
+from datetime import datetime, timedelta
 from math import ceil
+from os import path, replace
+
+# Files Rundeck keeps for each execution in its logs directory
+LOG_EXTENSIONS = ('.rdlog', '.state.json', '.execution.xml')
+
+# Defaults of options which asyncio-based client has no support for
+JOURNAL_PATH = '/tmp/rundeck-cleanup.journal'
+PREFETCH_PAGES = 2
 
 
 def parse_args(message=None):
@@ -25,6 +34,8 @@ def parse_args(message=None):
                         help='Rundeck database user (default: rundeck)')
     parser.add_argument('--db-pass', metavar='Password', type=str,
                         help='Rundeck database password')
+    parser.add_argument('--db-pool-size', metavar='Size', type=int, default=0,
+                        help='Rundeck database connections pooled between workers, 0 disables it (default: 0)')
     parser.add_argument('--filtered-project', metavar='Project', type=str, default=None,
                         help='Filter by a given project')
     parser.add_argument('--filtered-job', metavar='Job ID', type=str, default=None,
@@ -39,14 +50,106 @@ def parse_args(message=None):
                         help='Period of time to keep executions records (default: 30d)')
     parser.add_argument('--chunk-size', type=int, metavar='Size', default=200,
                         help='Size of each delete iteration (default: 200)')
+    parser.add_argument('--adaptive-chunk', action='store_true',
+                        help='Adjust chunk size from measured delete latency (default: false)')
+    parser.add_argument('--target-latency', type=float, metavar='Seconds', default=10.0,
+                        help='Delete latency targeted by adaptive chunk size (default: 10)')
+    parser.add_argument('--max-chunk-size', type=int, metavar='Size', default=2000,
+                        help='Upper bound of adaptive chunk size (default: 2000)')
     parser.add_argument('--retries', type=int, metavar='Number', default=5,
                         help='Number of retries when some error occur (default: 5)')
     parser.add_argument('--retry-delay', type=int, metavar='Seconds', default=5,
-                        help='Delay to start next retry (default: 5)')
+                        help='Delay to start first retry, doubled (with jitter) on each next one (default: 5)')
+    parser.add_argument('--max-retry-delay', type=int, metavar='Seconds', default=300,
+                        help='Upper bound of delays between retries (default: 300)')
+    parser.add_argument('--retry-budget', type=int, metavar='Number', default=200,
+                        help='Retries allowed in a whole run, 0 disables it (default: 200)')
+    parser.add_argument('--breaker-threshold', type=int, metavar='Number', default=5,
+                        help='Consecutive failed deletes pausing all workers, 0 disables it (default: 5)')
+    parser.add_argument('--breaker-cooldown', type=int, metavar='Seconds', default=60,
+                        help='Pause of all workers once consecutive deletes failed (default: 60)')
+    parser.add_argument('--throttle', action='store_true',
+                        help='Pause chunk deletion while Rundeck or its database are busy (default: false)')
+    parser.add_argument('--max-threads-running', type=int, metavar='Number', default=32,
+                        help='Database threads running above which deletion is throttled, 0 disables it (default: 32)')
+    parser.add_argument('--max-history-length', type=int, metavar='Number', default=500000,
+                        help='InnoDB history list length above which deletion is throttled, 0 disables it '
+                             '(default: 500000)')
+    parser.add_argument('--replica-host', metavar='Host', type=str, default=None,
+                        help='Database replica whose lag throttles deletion')
+    parser.add_argument('--max-replica-lag', type=int, metavar='Seconds', default=30,
+                        help='Replica lag above which deletion is throttled, 0 disables it (default: 30)')
+    parser.add_argument('--max-api-latency', type=float, metavar='Seconds', default=30.0,
+                        help='Average delete latency above which deletion is throttled, 0 disables it (default: 30)')
+    parser.add_argument('--max-error-rate', type=float, metavar='Ratio', default=0.2,
+                        help='Average delete error rate above which deletion is throttled, 0 disables it '
+                             '(default: 0.2)')
+    parser.add_argument('--throttle-max-pause', type=int, metavar='Seconds', default=300,
+                        help='Longest pause between checks of a busy system (default: 300)')
+    parser.add_argument('--purge-batch-size', type=int, metavar='Size', default=1000,
+                        help='Range of execution IDs deleted per transaction in db-purge mode (default: 1000)')
+    parser.add_argument('--purge-throttle', type=float, metavar='Seconds', default=0.5,
+                        help='Pause between db-purge transactions (default: 0.5)')
+    parser.add_argument('--logs-dir', metavar='Directory', type=str, default=None,
+                        help='Rundeck logs directory, where executions log files are deleted from')
+    parser.add_argument('--reap-expired', action='store_true',
+                        help='Also delete log files older than --keep-time in reap-logs mode (default: false)')
     parser.add_argument('--ssl-enabled', action='store_true',
                         help='Rundeck is served over SSL (default: false)')
+    parser.add_argument('--pool-size', type=int, metavar='Size', default=10,
+                        help='Number of pooled HTTP connections to Rundeck (default: 10)')
+    parser.add_argument('--http-retries', type=int, metavar='Number', default=3,
+                        help='Number of transport-level retries of HTTP requests (default: 3)')
+    parser.add_argument('--no-keep-alive', action='store_false', dest='keep_alive',
+                        help='Close HTTP connections after each request (default: false)')
+    parser.add_argument('--prefetch', type=int, metavar='Pages', default=PREFETCH_PAGES,
+                        help='Number of execution pages fetched ahead of deletion, 0 disables it (default: 2)')
+    parser.add_argument('--workers', type=int, metavar='Number', default=1,
+                        help='Number of projects (or jobs) cleaned concurrently (default: 1)')
+    parser.add_argument('--async-client', action='store_true',
+                        help='Use asyncio-based Rundeck client in cleanup and listing modes (default: false)')
+    parser.add_argument('--concurrency', type=int, metavar='Number', default=20,
+                        help='Concurrent HTTP requests of asyncio-based client (default: 20)')
+    parser.add_argument('--journal', metavar='File', type=str, default=JOURNAL_PATH,
+                        help='Checkpoint journal of cleanup runs (default: /tmp/rundeck-cleanup.journal)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted cleanup from its journal (default: false)')
+    parser.add_argument('--archive-dir', metavar='Directory', type=str, default=None,
+                        help='Directory where a record of each execution is archived before it is deleted')
+    parser.add_argument('--archive-max-size', type=int, metavar='MB', default=100,
+                        help='Size of archive files before a new one is started (default: 100)')
+    parser.add_argument('--catalog', metavar='File', type=str, default=None,
+                        help='Cache of projects, jobs and executions counters (e.g. /tmp/rundeck-catalog.json)')
+    parser.add_argument('--catalog-ttl', type=int, metavar='Seconds', default=3600,
+                        help='Time cached catalog entries are valid for, 0 disables the cache (default: 3600)')
+    parser.add_argument('--refresh-catalog', action='store_true',
+                        help='Request the whole catalog again, ignoring cached entries (default: false)')
+    parser.add_argument('--db-prescan', action='store_true',
+                        help='Count old executions in database first, only cleaning projects and jobs which '
+                             'have any (default: false)')
+    parser.add_argument('--probe', action='store_true',
+                        help='Exit right away, before connecting to Rundeck, when database has no execution '
+                             'older than --keep-time, in cleanup and db-purge modes (default: false)')
     parser.add_argument('--executions-by-project', action='store_false',
                         help='Filter executions by project (default: true)')
+    parser.add_argument('--plan-delete-latency', type=float, metavar='Seconds', default=1.0,
+                        help='Latency of each bulk delete assumed in plan mode (default: 1)')
+    parser.add_argument('--daemon-interval', type=int, metavar='Seconds', default=3600,
+                        help='Interval between passes in daemon mode (default: 3600)')
+    parser.add_argument('--pass-max-time', type=int, metavar='Seconds', default=600,
+                        help='Wall time budget of each pass in daemon mode, 0 disables it (default: 600)')
+    parser.add_argument('--pass-max-rows', type=int, metavar='Number', default=0,
+                        help='Executions deleted by each pass in daemon mode, 0 disables it (default: 0)')
+    parser.add_argument('--daemon-state', metavar='File', type=str, default='/tmp/rundeck-cleanup.state',
+                        help='High-water marks of daemon mode (default: /tmp/rundeck-cleanup.state)')
+    parser.add_argument('--output-format', metavar='Format', type=str, default='ndjson',
+                        help='Format of executions exported in inventory mode: ndjson or csv (default: ndjson)')
+    parser.add_argument('--output-file', metavar='File', type=str, default='-',
+                        help='File where executions are exported to in inventory mode (default: stdout)')
+    parser.add_argument('--metrics-prom', metavar='File', type=str, default=None,
+                        help='Prometheus textfile where cleanup metrics are written to')
+    parser.add_argument('--metrics-json', metavar='File', type=str, default=None,
+                        help='JSON file where a summary of cleanup metrics is written to')
     parser.add_argument('--running', action='store_true',
                         help='Filter only running executions (default: false)')
     parser.add_argument('--unoptimized', action='store_true',
@@ -58,19 +161,57 @@ def parse_args(message=None):
     return args
 
 
+def write_atomically(file_path, content):
+    '''Write a file through a temporary one, so a crash never leaves it truncated'''
+    tmp_path = '{0}.tmp'.format(file_path)
+
+    with open(tmp_path, 'w') as tmp_file:
+        tmp_file.write(content)
+
+    replace(tmp_path, file_path)
+
+
 def get_num_pages(n_executions, divider=200):
     '''...'''
 
     return int(ceil(n_executions / float(divider)))
 
 
+def get_cutoff_date(keep_time):
+    '''Return the date before which executions are considered old (same units as olderFilter)'''
+    number = int(keep_time[:-1])
+    unit = keep_time[-1:]
+    hours = {'h': 1, 'd': 24, 'w': 24 * 7, 'm': 24 * 30, 'y': 24 * 365}
+
+    return datetime.now() - timedelta(hours=number * hours[unit])
+
+
+def get_log_files(logs_dir, project, output_path):
+    '''Return log files of an execution, rebased on a local Rundeck logs directory'''
+    # Rundeck base directory may itself contain a directory named after the project,
+    # the one which counts is the closest to the log file
+    marker = '/{0}/'.format(project)
+    index = output_path.rfind(marker) if output_path else -1
+
+    if index < 0:
+        return []
+
+    log_base = path.join(logs_dir, output_path[index + 1:])
+    for extension in LOG_EXTENSIONS:
+        if log_base.endswith(extension):
+            log_base = log_base[:-len(extension)]
+            break
+
+    return [log_base + extension for extension in LOG_EXTENSIONS]
+
+
 def validate_configs(configs):
     '''Validate each parameter of the configurations'''
 
     if not (configs.port >= 1024 and configs.port <= 65535):
         return False, "Invalid port number."
 
-    if configs.api_version not in range(14, 21):
+    if configs.api_version < 14:
         return False, "Minimum API version not met."
 
     if configs.search_timeout <= 0:
@@ -82,6 +223,98 @@ def validate_configs(configs):
     if configs.chunk_size <= 0:
         return False, "Invalid chunk size value."
 
+    if configs.target_latency <= 0:
+        return False, "Invalid target latency value."
+
+    if configs.max_chunk_size < configs.chunk_size:
+        return False, "Maximum chunk size lower than chunk size."
+
+    if not (configs.db_pool_size >= 0 and configs.db_pool_size <= 32):
+        return False, "Invalid database pool size value."
+
+    # Every worker and the throttle hold a pooled connection of their own, besides the main one
+    if configs.db_pool_size and configs.db_pool_size < configs.workers + (1 if configs.throttle else 0) + 1:
+        return False, "Database pool size lower than workers (plus throttle) and main connections."
+
+    if min(configs.max_threads_running, configs.max_history_length, configs.max_replica_lag) < 0:
+        return False, "Invalid throttle threshold."
+
+    if configs.max_api_latency < 0 or not (configs.max_error_rate >= 0 and configs.max_error_rate <= 1):
+        return False, "Invalid throttle threshold."
+
+    if configs.throttle_max_pause <= 0:
+        return False, "Invalid throttle maximum pause value."
+
+    if configs.retries <= 0 or configs.retry_delay < 0 or configs.max_retry_delay < configs.retry_delay:
+        return False, "Invalid retries settings."
+
+    if configs.retry_budget < 0 or configs.breaker_threshold < 0 or configs.breaker_cooldown <= 0:
+        return False, "Invalid retry budget or circuit breaker settings."
+
+    if configs.purge_batch_size <= 0:
+        return False, "Invalid purge batch size value."
+
+    if configs.purge_throttle < 0:
+        return False, "Invalid purge throttle value."
+
+    if configs.logs_dir and not path.isdir(configs.logs_dir):
+        return False, "Invalid logs directory."
+
+    if configs.execution_mode == 'reap-logs' and not configs.logs_dir:
+        return False, "Missing logs directory to reap."
+
+    if configs.probe and configs.execution_mode not in ['cleanup', 'db-purge']:
+        return False, "Probe is only available in cleanup and db-purge modes."
+
+    if configs.prefetch < 0:
+        return False, "Invalid number of prefetched pages."
+
+    if configs.plan_delete_latency < 0:
+        return False, "Invalid plan delete latency value."
+
+    if configs.archive_dir and not path.isdir(configs.archive_dir):
+        return False, "Invalid archive directory."
+
+    if configs.archive_max_size <= 0:
+        return False, "Invalid archive maximum size value."
+
+    if configs.catalog_ttl < 0:
+        return False, "Invalid catalog TTL value."
+
+    if configs.daemon_interval <= 0:
+        return False, "Invalid daemon interval value."
+
+    if configs.pass_max_time < 0 or configs.pass_max_rows < 0:
+        return False, "Invalid daemon pass budget."
+
+    if configs.output_format not in ['ndjson', 'csv']:
+        return False, "Invalid output format."
+
+    if configs.concurrency <= 0:
+        return False, "Invalid concurrency value."
+
+    if configs.async_client and configs.execution_mode == 'cleanup':
+        unsupported = [option for option, is_set in (
+            ('--executions-by-project', not configs.executions_by_project),
+            ('--journal', configs.journal != JOURNAL_PATH),
+            ('--resume', configs.resume),
+            ('--archive-dir', configs.archive_dir),
+            ('--throttle', configs.throttle),
+            ('--workers', configs.workers > 1),
+            ('--prefetch', configs.prefetch != PREFETCH_PAGES)) if is_set]
+
+        if unsupported:
+            return False, "Asyncio-based client does not support {0}.".format(', '.join(unsupported))
+
+    if configs.workers <= 0:
+        return False, "Invalid number of workers."
+
+    if configs.pool_size <= 0:
+        return False, "Invalid HTTP pool size value."
+
+    if configs.http_retries < 0:
+        return False, "Invalid number of HTTP retries."
+
     number = configs.keep_time[:-1]
     unit = configs.keep_time[-1:]
 
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+import threading
+
+from json import dumps, load
+from os import path
+from time import time
+from .base import write_atomically
+
+# Changes are written to disk at most this often, besides on close
+SAVE_INTERVAL = 10
+
+
+class Catalog(object):
+    '''
+    This class caches on disk the catalog of Rundeck (projects, jobs of each project
+    and the last known executions counters), so runs starting within ttl seconds of
+    its last refresh don't have to request it again.
+
+    Entries are kept apart by namespace (the URL of Rundeck API), so instances sharing
+    a catalog file, or pointed at another server, never read each other's entries.
+    Each entry expires on its own, and refresh drops every entry of the namespace at
+    start. A ttl of 0 disables the cache.
+    '''
+
+    def __init__(self, catalog_path, namespace, ttl=3600, refresh=False):
+        '''Initialization of global variables'''
+        self._path = catalog_path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._catalog = {}
+        self._dirty = False
+        self._saved = time()
+
+        if ttl > 0 and path.isfile(catalog_path):
+            try:
+                with open(catalog_path) as catalog_file:
+                    self._catalog = load(catalog_file)
+            except ValueError:
+                self._catalog = {}
+
+        if refresh:
+            self._dirty = self._catalog.pop(namespace, None) is not None
+
+        self._entries = self._catalog.setdefault(namespace, {})
+
+    def __save(self):
+        '''Write catalog to disk'''
+        write_atomically(self._path, dumps(self._catalog, separators=(',', ':')))
+        self._dirty = False
+        self._saved = time()
+
+    def get(self, key):
+        '''Return a cached value, or None if it is unknown or expired'''
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if not entry or time() - entry['time'] > self._ttl:
+                return None
+
+            return entry['value']
+
+    def put(self, key, value):
+        '''Cache a value'''
+        if self._ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = {'value': value, 'time': time()}
+            self._dirty = True
+
+            if time() - self._saved > SAVE_INTERVAL:
+                self.__save()
+
+    def invalidate(self):
+        '''Drop every entry of the namespace, e.g. when one of them turned out to be stale'''
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def close(self):
+        '''Write pending changes to disk'''
+        with self._lock:
+            if self._dirty:
+                self.__save()
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+
+import threading
+
+from json import dumps, load
+from os import path
+from time import gmtime, mktime, strftime, time
+from .base import get_cutoff_date, write_atomically
+
+# Windows overlap by this many seconds, so a clock running ahead of Rundeck server
+# can not move a high-water mark past executions which were not old yet for Rundeck
+SKEW_MARGIN = 3600
+
+
+class PassBudget(object):
+    '''
+    This class bounds the work of a daemon pass, by wall time and/or by deleted rows
+    (0 means unbounded). It is checked between chunks, so a pass may overshoot it by
+    at most one chunk.
+    '''
+
+    def __init__(self, max_time=0, max_rows=0, stop=None):
+        '''Initialization of global variables'''
+        self._deadline = time() + max_time if max_time else None
+        self._max_rows = max_rows
+        self._stop = stop
+        self.rows = 0
+
+    def consume(self, rows):
+        '''Account executions deleted in this pass'''
+        self.rows += rows
+
+    def exhausted(self):
+        '''Check whether the pass must stop before its next chunk'''
+        if self._stop and self._stop.is_set():
+            return True
+        if self._deadline and time() >= self._deadline:
+            return True
+
+        return bool(self._max_rows) and self.rows >= self._max_rows
+
+
+class CleanupDaemon(object):
+    '''
+    This class keeps cleaning executions in small passes, instead of one cleanup of
+    the whole backlog per run.
+
+    Each pass only looks at executions which completed between the high-water mark
+    of a project, which is the cutoff date of its last complete pass, and the current
+    cutoff date. A pass ends when every project is clean or when its budget is spent,
+    and the next one starts from the project it stopped at. High-water marks are kept
+    on disk, so a restarted daemon does not scan again what was already cleaned.
+    '''
+
+    def __init__(self, rdeck, log, metrics, state_path, keep_time='30d', interval=3600, max_time=0, max_rows=0,
+                 metrics_prom=None, metrics_json=None):
+        '''Initialization of global variables'''
+        self._rdeck = rdeck
+        self._log = log
+        self._metrics = metrics
+        self._path = state_path
+        self._keep_time = keep_time
+        self._interval = interval
+        self._max_time = max_time
+        self._max_rows = max_rows
+        self._metrics_prom = metrics_prom
+        self._metrics_json = metrics_json
+        self._stop = threading.Event()
+        self._state = {'high_water': {}, 'cursor': None}
+
+        if state_path and path.isfile(state_path):
+            with open(state_path) as state_file:
+                self._state.update(load(state_file))
+
+    def __save(self):
+        '''Write state to disk'''
+        if not self._path:
+            return
+
+        write_atomically(self._path, dumps(self._state, separators=(',', ':')))
+
+    def stop(self):
+        '''Ask the daemon to stop after the chunk being deleted'''
+        self._stop.set()
+
+    def __order(self, projects):
+        '''Return projects starting from the one the last pass stopped at'''
+        cursor = self._state['cursor']
+
+        if cursor in projects:
+            index = projects.index(cursor)
+            return projects[index:] + projects[:index]
+
+        return projects
+
+    def run_pass(self, project=None, retries=5, backoff=5, unoptimized=False):
+        '''Clean executions which became old since the last pass, within the pass budget'''
+        start = time()
+        # Rundeck expects dates in UTC
+        cutoff = mktime(get_cutoff_date(self._keep_time).timetuple())
+        mark = strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(cutoff - SKEW_MARGIN))
+        budget = PassBudget(self._max_time, self._max_rows, self._stop)
+
+        if project:
+            status, projects = True, [project]
+        else:
+            status, projects = self._rdeck.get_projects()
+
+        if not status:
+            return False, projects
+
+        failed = []
+        cleaned = 0
+
+        for proj in self.__order(projects):
+            if budget.exhausted():
+                self._state['cursor'] = proj
+                break
+
+            begin = self._state['high_water'].get(proj)
+            self._rdeck.set_pass(begin, budget)
+            status, data = self._rdeck.clean_project_executions(proj, retries, backoff, unoptimized)
+
+            if not status:
+                self._log.write(data, 4)
+                failed.append(proj)
+            elif not budget.exhausted():
+                self._state['high_water'][proj] = mark
+                cleaned += 1
+            else:
+                # Stopped halfway, so this project is cleaned first on the next pass
+                self._state['cursor'] = proj
+                break
+        else:
+            self._state['cursor'] = None
+
+        self._rdeck.set_pass()
+        self.__save()
+
+        msg = 'Pass statistics: {0} executions deleted, {1} of {2} projects caught up in {3:.1f}s{4}.'.format(
+            budget.rows, cleaned, len(projects), time() - start, ' (budget spent)' if budget.exhausted() else '')
+        self._log.write(msg)
+
+        if failed:
+            return False, 'Error cleaning executions of: {0}.'.format(', '.join(failed))
+
+        return True, ''
+
+    def run(self, project=None, retries=5, backoff=5, unoptimized=False):
+        '''Run a pass every interval until stopped'''
+        while not self._stop.is_set():
+            start = time()
+
+            with self._metrics.timer('pass'):
+                status, msg = self.run_pass(project, retries, backoff, unoptimized)
+
+            # A failed pass is retried on the next one, the daemon itself keeps running
+            if not status:
+                self._metrics.incr('failed_passes')
+                self._log.write(msg, 4)
+
+            self._metrics.incr('passes')
+
+            if self._metrics_prom:
+                self._metrics.write_prometheus(self._metrics_prom)
+            if self._metrics_json:
+                self._metrics.write_json(self._metrics_json)
+
+            wait = max(self._interval - (time() - start), 0)
+            msg = 'Next pass in {0:.0f} seconds.'.format(wait)
+            self._log.write(msg, 1)
+            self._stop.wait(wait)
+
+        return True, ''
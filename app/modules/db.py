@@ -1,33 +1,84 @@
 #!/usr/bin/python3
 
-from mysql.connector import errorcode, connect, Error
+import threading
+
+from collections import OrderedDict
+from time import time
+from .ids import IdBatch
+
+# Serializes the creation of pools, which clones may all ask for at once
+POOL_LOCK = threading.Lock()
+
+
+def get_placeholders(size):
+    '''Return a list of bound parameters markers to be used in a IN (...) clause'''
+    return ','.join(['%s'] * size)
 
 
 class DatabaseConn(object):
     '''
     Class to initialize and manage all operations in
     Rundeck database.
+
+    A single connection is kept open for the whole run and is only re-established
+    when it is found dead. When a pool size is given, connections are borrowed from
+    a pool shared by every clone of this object, so concurrent callers don't have
+    to pay a new connection handshake.
+
+    Nothing is done before the first query: MySQL connector is only imported, and the
+    connection (or pool) only opened then, so modes which never query the database
+    don't pay for either.
     '''
 
     _connection = None
     _session = None
+    _prepared = None
+    _pool = None
+    _dirty = False
+    _last_used = 0
+    _replica_status = 'SHOW REPLICA STATUS'
 
-    def __init__(self, dbname, user, password, host='127.0.0.1', port=3306):
+    def __init__(self, dbname, user, password, host='127.0.0.1', port=3306, pool_size=0, pool=None,
+                 idle_check=30):
         '''Initialization of global variables'''
         self._dbname = dbname
         self._user = user
         self._password = password
         self._host = host
         self._port = port
+        self._pool_size = pool_size
+        # Holder of the pool shared by this object and its clones, filled on first use
+        self._pool = pool if pool is not None else [None]
+        self._idle_check = idle_check
+
+    def __get_pool(self):
+        '''Return the pool shared by every clone, creating it on first use'''
+        if self._pool_size > 0 and not self._pool[0]:
+            with POOL_LOCK:
+                if not self._pool[0]:
+                    from mysql.connector.pooling import MySQLConnectionPool
+
+                    self._pool[0] = MySQLConnectionPool(pool_name='rundeck', pool_size=self._pool_size,
+                                                        user=self._user, password=self._password,
+                                                        database=self._dbname, host=self._host, port=self._port)
 
-        self.open()
+        return self._pool[0]
 
     def open(self):
         '''Open a new connection session to database'''
+        from mysql.connector import errorcode, connect, Error
+
         try:
-            self._connection = connect(user=self._user, password=self._password,
-                                       database=self._dbname, host=self._host, port=self._port)
-            self._session = self._connection.cursor()
+            pool = self.__get_pool()
+
+            if pool:
+                self._connection = pool.get_connection()
+            else:
+                self._connection = connect(user=self._user, password=self._password,
+                                           database=self._dbname, host=self._host, port=self._port)
+            self._session = self._connection.cursor(buffered=True)
+            self._prepared = self._connection.cursor(prepared=True)
+            self._last_used = time()
         except Error as err:
             self._connection = False
             if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
@@ -37,20 +88,254 @@ class DatabaseConn(object):
             else:
                 self._session = err
 
+    def is_alive(self):
+        '''Check whether the current connection still answers, reconnecting it if needed'''
+        if not self._connection:
+            return False
+
+        from mysql.connector import Error
+
+        try:
+            self._connection.ping(reconnect=True, attempts=3, delay=1)
+        except Error:
+            return False
+
+        if not self._session or isinstance(self._session, (str, Error)):
+            self._session = self._connection.cursor(buffered=True)
+            self._prepared = self._connection.cursor(prepared=True)
+
+        return True
+
+    def clone(self):
+        '''Return a new object with the same settings but its own connection'''
+        return DatabaseConn(self._dbname, self._user, self._password, self._host, self._port,
+                            self._pool_size, self._pool, self._idle_check)
+
     def close(self):
         '''Close both session and connection to database'''
-        self._session.close()
-        self._connection.close()
+        if not self._connection:
+            return
+
+        from mysql.connector import Error
 
-    def query(self, query):
-        '''Return results from a given query'''
-        if not self._connection.is_connected or not self._session:
+        try:
+            if self._prepared:
+                self._prepared.close()
+            self._session.close()
+            self._connection.close()
+        except Error:
+            pass
+
+        self._connection = None
+        self._session = None
+        self._prepared = None
+        self._dirty = False
+
+    def query(self, query, parameters=None):
+        '''Return results from a given query, binding parameters in a prepared statement if given'''
+        from mysql.connector import errors, Error
+
+        # Only ping connections which have been idle for a while, a busy connection
+        # is checked for free by the statements themselves
+        if not self._connection or time() - self._last_used > self._idle_check:
+            if not self.is_alive():
+                self.close()
+                self.open()
+
+            if not self._connection:
+                raise Error('Unable to connect to database: {0}'.format(self._session))
+
+        try:
+            cursor = self.__execute(query, parameters)
+        except (errors.OperationalError, errors.InterfaceError):
+            # Connection dropped (e.g. server restart or wait_timeout): reconnect and replay
+            # the statement, unless it was part of a transaction which is now lost
+            if self._dirty:
+                self._dirty = False
+                raise
+            self.close()
             self.open()
 
-        self._session.execute(query)
+            if not self._connection:
+                raise Error('Unable to connect to database: {0}'.format(self._session))
+
+            cursor = self.__execute(query, parameters)
+
+        if not query.lstrip().upper().startswith(('SELECT', 'SHOW')):
+            self._dirty = True
+
+        self._last_used = time()
+
+        return cursor
+
+    def __execute(self, query, parameters=None):
+        '''Run a statement in the right cursor'''
+        if parameters is None:
+            self._session.execute(query)
+            return self._session
+
+        self._prepared.execute(query, tuple(parameters))
+
+        return self._prepared
+
+    def get_execution_records(self, executions_ids):
+        '''Return what is known about the given executions, as one dictionary by execution'''
+        if not executions_ids:
+            return []
+
+        records = []
+        stmt = 'SELECT e.id, e.project, se.uuid AS job_id, se.job_name, e.status, e.rduser AS user, e.argstring, ' \
+               'e.date_started, e.date_completed, e.outputfilepath AS log_file, br.node, br.message ' \
+               'FROM execution e ' \
+               'LEFT JOIN scheduled_execution se ON se.id = e.scheduled_execution_id ' \
+               'LEFT JOIN base_report br ON br.jc_exec_id = CAST(e.id AS CHAR) ' \
+               'WHERE e.id IN ({0})'
+
+        for markers, parameters in IdBatch.of(executions_ids).params():
+            cursor = self.query(stmt.format(markers), parameters)
+            columns = [column[0] for column in cursor.description]
+            records.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+
+        return records
+
+    def get_workflows_by_execution(self, executions_ids):
+        '''Return workflow ID and workflow step IDs of each of the given executions, in one round trip'''
+        workflows = OrderedDict()
 
-        return self._session
+        if not executions_ids:
+            return workflows
+
+        stmt = 'SELECT e.id, e.workflow_id, wws.workflow_step_id FROM execution e ' \
+               'LEFT JOIN workflow_workflow_step wws ON wws.workflow_commands_id = e.workflow_id ' \
+               'WHERE e.id IN ({0})'
+
+        for markers, parameters in IdBatch.of(executions_ids).params():
+            for exec_id, workflow_id, workflow_step_id in self.query(stmt.format(markers), parameters).fetchall():
+                if workflow_id is None:
+                    continue
+
+                entry = workflows.setdefault(int(exec_id), (int(workflow_id), []))
+
+                if workflow_step_id is not None:
+                    entry[1].append(int(workflow_step_id))
+
+        return workflows
+
+    def get_existing_executions(self, executions_ids):
+        '''Return which of the given executions are still in database'''
+        existing = IdBatch()
+
+        for markers, parameters in IdBatch.of(executions_ids).params():
+            stmt = 'SELECT id FROM execution WHERE id IN ({0})'.format(markers)
+            existing.extend(int(row[0]) for row in self.query(stmt, parameters).fetchall())
+
+        return existing
+
+    def count_workflow_rows(self, cutoff):
+        '''Return workflows and workflow steps of executions older than a date, by project'''
+        stmt = 'SELECT e.project, COUNT(DISTINCT e.workflow_id), COUNT(wws.workflow_step_id) FROM execution e ' \
+               'LEFT JOIN workflow_workflow_step wws ON wws.workflow_commands_id = e.workflow_id ' \
+               'WHERE e.date_completed < %s GROUP BY e.project'
+
+        return dict((row[0], (int(row[1]), int(row[2]))) for row in self.query(stmt, [cutoff]).fetchall())
+
+    def get_load(self):
+        '''Return threads running and InnoDB history list length of the server'''
+        threads = self.query('SHOW GLOBAL STATUS LIKE \'Threads_running\'').fetchone()
+        history = self.query('SELECT count FROM information_schema.innodb_metrics '
+                             'WHERE name = \'trx_rseg_history_len\'').fetchone()
+
+        return int(threads[1]) if threads else 0, int(history[0]) if history else 0
+
+    def get_replica_lag(self):
+        '''Return replication lag in seconds, or None if this server is not a running replica'''
+        from mysql.connector import errors
+
+        # MySQL 8.0.22 renamed both the statement and its lag column, older servers only
+        # know the former ones (remembered once found out), and MariaDB accepts the new
+        # statement with the old column
+        try:
+            cursor = self.query(self._replica_status)
+        except errors.ProgrammingError:
+            if self._replica_status == 'SHOW SLAVE STATUS':
+                raise
+            self._replica_status = 'SHOW SLAVE STATUS'
+            cursor = self.query(self._replica_status)
+
+        row = cursor.fetchone()
+
+        if not row:
+            return None
+
+        status = dict(zip(cursor.column_names, row))
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+        return int(lag) if lag is not None else None
+
+    def count_old_executions(self, cutoff):
+        '''Return counters of executions older than a date, by project and job (None for ad hoc ones)'''
+        counters = {}
+        stmt = 'SELECT e.project, se.uuid, COUNT(*) FROM execution e ' \
+               'LEFT JOIN scheduled_execution se ON se.id = e.scheduled_execution_id ' \
+               'WHERE e.date_completed < %s GROUP BY e.project, se.uuid'
+
+        for project, job, total in self.query(stmt, [cutoff]).fetchall():
+            counters.setdefault(project, {})[job] = int(total)
+
+        return counters
+
+    def has_old_executions(self, cutoff, project=None):
+        '''Return whether any execution (of a project, if given) is older than a date'''
+        stmt = 'SELECT 1 FROM execution WHERE date_completed < %s'
+        parameters = [cutoff]
+
+        if project:
+            stmt += ' AND project = %s'
+            parameters.append(project)
+
+        return self.query(stmt + ' LIMIT 1', parameters).fetchone() is not None
+
+    def delete_workflows(self, workflow_ids, workflow_step_ids, unoptimized=False, commit=True):
+        '''Bulk deletions of Rundeck workflow tables in a single transaction'''
+        workflow_ids = IdBatch.of(workflow_ids)
+
+        if unoptimized:
+            for markers, parameters in workflow_ids.params():
+                stmt = 'DELETE FROM workflow_workflow_step WHERE workflow_commands_id IN ({0})'.format(markers)
+                self.query(stmt, parameters)
+
+        for markers, parameters in IdBatch.of(workflow_step_ids).params():
+            stmt = 'DELETE FROM workflow_step WHERE id IN ({0})'.format(markers)
+            self.query(stmt, parameters)
+
+        for markers, parameters in workflow_ids.params():
+            stmt = 'DELETE FROM workflow WHERE id IN ({0})'.format(markers)
+            self.query(stmt, parameters)
+
+        if commit:
+            self.apply()
 
     def apply(self):
         '''Commit changes in database'''
+        if not self._connection:
+            from mysql.connector import Error
+
+            raise Error('Unable to commit, no connection to database: {0}'.format(self._session))
+
         self._connection.commit()
+        self._dirty = False
+
+    def rollback(self):
+        '''Discard uncommitted changes in database'''
+        self._dirty = False
+
+        # Nothing to discard when the connection is gone, and with it the transaction
+        if not self._connection:
+            return
+
+        from mysql.connector import Error
+
+        try:
+            self._connection.rollback()
+        except Error:
+            pass
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+
+from csv import writer
+from json import dumps
+from sys import stdout
+
+CSV_COLUMNS = ('id', 'project', 'job_id', 'job_name', 'status', 'user', 'date_started', 'date_ended', 'duration_ms')
+
+
+class ExecutionsWriter(object):
+    '''
+    This class writes execution records to a file (or stdout) as they are received,
+    either as newline-delimited JSON or as CSV with a flat set of columns.
+    '''
+
+    def __init__(self, output='-', output_format='ndjson'):
+        '''Initialization of global variables'''
+        self._format = output_format
+        self._file = stdout if output == '-' else open(output, 'w', newline='')
+        self._csv = None
+        self._count = 0
+
+        if output_format == 'csv':
+            self._csv = writer(self._file)
+            self._csv.writerow(CSV_COLUMNS)
+
+    @staticmethod
+    def flatten(execution):
+        '''Return CSV columns of an execution record'''
+        job = execution.get('job') or {}
+        started = (execution.get('date-started') or {}).get('unixtime')
+        ended = (execution.get('date-ended') or {}).get('unixtime')
+
+        return (execution.get('id'), execution.get('project'), job.get('id', ''), job.get('name', ''),
+                execution.get('status'), execution.get('user'),
+                (execution.get('date-started') or {}).get('date', ''),
+                (execution.get('date-ended') or {}).get('date', ''),
+                ended - started if started and ended else '')
+
+    @property
+    def count(self):
+        '''Number of records written so far'''
+        return self._count
+
+    def write(self, execution):
+        '''Append an execution record to the output'''
+        if self._csv:
+            self._csv.writerow(self.flatten(execution))
+        else:
+            self._file.write(dumps(execution, separators=(',', ':')))
+            self._file.write('\n')
+
+        self._count += 1
+
+    def close(self):
+        '''Flush records written, closing the output unless it is stdout'''
+        self._file.flush()
+
+        if self._file is not stdout:
+            self._file.close()
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+
+from array import array
+
+# Most IDs bound in a single IN (...) clause, well below the 65,535 placeholders
+# MySQL accepts in a prepared statement
+MAX_PARAMETERS = 1000
+
+
+class IdBatch(object):
+    '''
+    This class holds a batch of execution, workflow or step IDs as a packed array of
+    64 bits integers, instead of a list of Python objects, and knows how to hand them
+    over to Rundeck API (JSON), to the database (bound parameters) and to logs (a
+    summary of their count and range rather than every ID).
+    '''
+
+    __slots__ = ('_ids',)
+
+    def __init__(self, ids=()):
+        '''Initialization of global variables'''
+        self._ids = ids if isinstance(ids, array) else array('q', ids)
+
+    @classmethod
+    def of(cls, ids):
+        '''Return the given IDs as a batch, without copying them if they already are one'''
+        return ids if isinstance(ids, cls) else cls(ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return IdBatch(self._ids[index])
+
+        return self._ids[index]
+
+    def __eq__(self, other):
+        return isinstance(other, IdBatch) and self._ids == other._ids
+
+    def __repr__(self):
+        return 'IdBatch({0})'.format(self.summary())
+
+    def append(self, identifier):
+        '''Add an ID to the batch'''
+        self._ids.append(identifier)
+
+    def extend(self, ids):
+        '''Add several IDs to the batch'''
+        self._ids.extend(ids._ids if isinstance(ids, IdBatch) else ids)
+
+    def to_json(self):
+        '''Return the batch as a JSON array, as Rundeck API expects for bulk deletes'''
+        return '[{0}]'.format(','.join(map(str, self._ids)))
+
+    def params(self, size=MAX_PARAMETERS, text=False):
+        '''
+        Yield the batch as bound parameters, along with their markers for a IN (...) clause,
+        in slices of at most the given size so that large batches need several statements.
+        IDs are bound as strings when compared to a text column, so its index can be used
+        '''
+        for start in range(0, len(self._ids), size):
+            parameters = self._ids[start:start + size]
+            if text:
+                parameters = [str(identifier) for identifier in parameters]
+            yield ','.join(['%s'] * len(parameters)), parameters
+
+    def summary(self):
+        '''Describe the batch by its size and range of IDs'''
+        if not self._ids:
+            return '0 IDs'
+
+        return '{0} IDs from {1} to {2}'.format(len(self._ids), min(self._ids), max(self._ids))
+
+
+def get_failed_executions(executions_ids, result):
+    '''
+    Return status of a bulk delete of executions, from its decoded response, along with
+    which of them could not be deleted. Executions which are already gone count as deleted
+    '''
+    if not isinstance(result, dict):
+        return False, executions_ids
+    elif result.get('allsuccessful'):
+        return True, IdBatch()
+
+    failed = IdBatch(int(failure['id']) for failure in result.get('failures', [])
+                     if 'not found' not in str(failure.get('message', '')).lower())
+
+    return not failed, failed
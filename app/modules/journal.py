@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+import threading
+
+from json import dumps, load
+from os import path, remove
+from .base import write_atomically
+
+
+class Journal(object):
+    '''
+    This class keeps an on-disk checkpoint of a cleanup run, so an interrupted run
+    can be resumed where it stopped.
+
+    It records which projects and jobs are already clean, and every chunk which is
+    being deleted. A chunk stays pending from the moment its workflow IDs are known
+    until its workflow rows are gone, so a chunk deleted from Rundeck API but not from
+    workflow tables is never lost, not even by a later run which does not resume: it
+    starts over on every project, but still keeps those chunks to finish them first.
+    Each change is written to a temporary file and atomically renamed.
+    '''
+
+    def __init__(self, journal_path, resume=False):
+        '''Initialization of global variables'''
+        self._path = journal_path
+        self._lock = threading.Lock()
+        self._state = {'completed': [], 'pending': {}}
+
+        if path.isfile(journal_path):
+            with open(journal_path) as journal_file:
+                state = load(journal_file)
+
+            self._state['pending'] = state.get('pending', {})
+            if resume:
+                self._state['completed'] = state.get('completed', [])
+
+        self.__save()
+
+    def __save(self):
+        '''Write journal to disk'''
+        write_atomically(self._path, dumps(self._state, separators=(',', ':')))
+
+    def is_completed(self, identifier):
+        '''Check whether a project or job was already cleaned'''
+        with self._lock:
+            return identifier in self._state['completed']
+
+    def complete(self, identifier):
+        '''Mark a project or job as cleaned'''
+        with self._lock:
+            if identifier not in self._state['completed']:
+                self._state['completed'].append(identifier)
+                self.__save()
+
+    def add_pending(self, identifier, executions, workflows, steps):
+        '''Record a chunk which is about to be deleted, returning its key'''
+        key = '{0}:{1}'.format(identifier, min(executions))
+
+        with self._lock:
+            self._state['pending'][key] = {
+                'identifier': identifier,
+                'executions': list(executions),
+                'workflows': list(workflows),
+                'steps': list(steps)
+            }
+            self.__save()
+
+        return key
+
+    def done_pending(self, key):
+        '''Forget a chunk whose data is fully deleted'''
+        with self._lock:
+            self._state['pending'].pop(key, None)
+            self.__save()
+
+    def pending(self):
+        '''Return all chunks left half-done, as (key, entry) pairs'''
+        with self._lock:
+            return list(self._state['pending'].items())
+
+    def clear(self):
+        '''Remove the journal once a run finished successfully'''
+        with self._lock:
+            self._state = {'completed': [], 'pending': {}}
+
+            if path.isfile(self._path):
+                remove(self._path)
@@ -13,13 +13,14 @@ class Logger(object):
 
     _log = None
 
-    def __init__(self, level=2, formatter=None):
+    def __init__(self, level=2, formatter=None, stream=stdout):
         if not formatter:
             self._formatter = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         else:
             self._formatter = formatter
 
         self._level = level
+        self._stream = stream
         self._log = getLogger()
         self.__set_level()
         self.__attach_handler()
@@ -39,7 +40,7 @@ class Logger(object):
 
     def __attach_handler(self):
         '''...'''
-        handler = StreamHandler(stdout)
+        handler = StreamHandler(self._stream)
         handler.setFormatter(Formatter(self._formatter))
 
         if self._level == 1:
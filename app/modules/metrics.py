@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+import threading
+
+from contextlib import contextmanager
+from json import dumps
+from time import time
+from .base import write_atomically
+
+# Upper bounds (in seconds) of the histogram buckets of each phase
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float('inf'))
+
+
+class Metrics(object):
+    '''
+    This class collects timings of each phase of a cleanup (page fetch, workflow lookup,
+    API bulk delete, workflow tables deletes, commit and retry sleeps) and counters
+    (executions deleted, retries, failures), broken down by project.
+
+    They can be exported at the end of a run as a Prometheus textfile, to be picked up
+    by node_exporter textfile collector, and/or as a JSON summary.
+    '''
+
+    def __init__(self):
+        '''Initialization of global variables'''
+        self._lock = threading.Lock()
+        self._start = time()
+        self._timers = {}
+        self._counters = {}
+
+    def observe(self, phase, seconds, project=''):
+        '''Account a duration of a phase'''
+        key = (phase, project)
+
+        with self._lock:
+            timer = self._timers.setdefault(key, [0, 0.0, 0.0, [0] * len(BUCKETS)])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timer[3][index] += 1
+                    break
+
+    @contextmanager
+    def timer(self, phase, project=''):
+        '''Context manager timing the enclosed block as a phase'''
+        start = time()
+
+        try:
+            yield
+        finally:
+            self.observe(phase, time() - start, project)
+
+    def incr(self, counter, value=1, project=''):
+        '''Increment a counter'''
+        key = (counter, project)
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def summary(self):
+        '''Return all metrics as a dictionary'''
+        with self._lock:
+            elapsed = time() - self._start
+            phases = {}
+            counters = {}
+
+            for (phase, project), (count, total, maximum, _) in sorted(self._timers.items()):
+                phases.setdefault(phase, {})[project or '_'] = {
+                    'count': count,
+                    'seconds': round(total, 6),
+                    'average': round(total / count, 6) if count else 0,
+                    'max': round(maximum, 6)
+                }
+
+            for (counter, project), value in sorted(self._counters.items()):
+                counters.setdefault(counter, {})[project or '_'] = value
+
+            deleted = sum(counters.get('executions_deleted', {}).values())
+
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'executions_per_second': round(deleted / elapsed, 3) if elapsed else 0,
+                'phases': phases,
+                'counters': counters
+            }
+
+    def write_json(self, file_path):
+        '''Write a JSON summary of all metrics'''
+        write_atomically(file_path, dumps(self.summary(), indent=2, sort_keys=True))
+
+    def write_prometheus(self, file_path):
+        '''Write all metrics in Prometheus text format, atomically as textfile collector expects'''
+        lines = [
+            '# HELP rundeck_cleanup_phase_seconds Duration of each phase of executions cleanup.',
+            '# TYPE rundeck_cleanup_phase_seconds histogram'
+        ]
+
+        with self._lock:
+            for (phase, project), (count, total, _, buckets) in sorted(self._timers.items()):
+                labels = 'phase="{0}",project="{1}"'.format(phase, escape_label(project))
+                cumulative = 0
+
+                for bound, value in zip(BUCKETS, buckets):
+                    cumulative += value
+                    upper = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('rundeck_cleanup_phase_seconds_bucket{{{0},le="{1}"}} {2}'.format(
+                        labels, upper, cumulative))
+
+                lines.append('rundeck_cleanup_phase_seconds_sum{{{0}}} {1}'.format(labels, total))
+                lines.append('rundeck_cleanup_phase_seconds_count{{{0}}} {1}'.format(labels, count))
+
+            for counter in sorted(set(key[0] for key in self._counters)):
+                lines.append('# TYPE rundeck_cleanup_{0}_total counter'.format(counter))
+
+                for (name, project), value in sorted(self._counters.items()):
+                    if name == counter:
+                        lines.append('rundeck_cleanup_{0}_total{{project="{1}"}} {2}'.format(
+                            counter, escape_label(project), value))
+
+            lines.append('# TYPE rundeck_cleanup_last_run_seconds gauge')
+            lines.append('rundeck_cleanup_last_run_seconds {0}'.format(time() - self._start))
+            lines.append('# TYPE rundeck_cleanup_last_run_timestamp_seconds gauge')
+            lines.append('rundeck_cleanup_last_run_timestamp_seconds {0}'.format(int(time())))
+
+        write_atomically(file_path, '\n'.join(lines) + '\n')
+
+
+def escape_label(value):
+    '''Escape a Prometheus label value'''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+from time import time
+from mysql.connector import Error
+from .base import get_cutoff_date, get_num_pages
+
+
+class CleanupPlanner(object):
+    '''
+    This class estimates how much work a cleanup is, without deleting anything.
+
+    Jobs and executions counters are requested to Rundeck API for every project (or
+    job) at once, from a pool of workers (unless the catalog still knows them), while
+    workflow and step rows are counted in a single grouped query. The projected
+    duration assumes each chunk costs one page fetch, plus one bulk delete, whose
+    latency is given. Latencies are always measured on Rundeck API, never on
+    counters served by the catalog.
+    '''
+
+    def __init__(self, rdeck, db_conn, log, chunk_size=200, keep_time='30d', workers=4, delete_latency=1.0):
+        '''Initialization of global variables'''
+        self._rdeck = rdeck
+        self._db = db_conn
+        self._log = log
+        self._chunk_size = chunk_size
+        self._keep_time = keep_time
+        self._workers = workers
+        self._delete_latency = delete_latency
+
+    def __count(self, identifiers, jobs=False):
+        '''
+        Return executions counter of each project, or of each job given as a (job,
+        project) pair, concurrently
+        '''
+        def count(client, identifier):
+            '''Worker body: request a counter with the client its thread owns'''
+            project = None
+            if jobs:
+                identifier, project = identifier
+
+            status, total = client.get_total_executions(identifier, jobs, True, project)
+
+            return identifier, status, total
+
+        return list(self._rdeck.map_clones(count, identifiers, self._workers))
+
+    def __list_jobs(self, projects):
+        '''Return jobs of each project, as (job, project) pairs, requested concurrently'''
+        jobs = []
+
+        def list_jobs(client, project):
+            '''Worker body: request jobs of a project with the client its thread owns'''
+            return (project,) + tuple(client.get_jobs_by_project(project))
+
+        for project, status, data in list(self._rdeck.map_clones(list_jobs, projects, self._workers)):
+            if not status:
+                return False, data
+            jobs.extend([(job, project) for job in data])
+
+        return True, jobs
+
+    def __measure_count(self, project):
+        '''Return how long requesting an executions counter takes, bypassing the catalog'''
+        start = time()
+        self._rdeck.get_total_executions(project, False)
+
+        return time() - start
+
+    def __measure_fetch(self, project):
+        '''Return how long fetching a full page of executions takes'''
+        start = time()
+        self._rdeck.get_executions(project, 0, False, size=self._chunk_size)
+
+        return time() - start
+
+    def plan(self, project=None, project_order=True):
+        '''Report executions, workflow rows, chunks and projected duration of a cleanup'''
+        start = time()
+
+        if project:
+            status, projects = True, [project]
+        else:
+            status, projects = self._rdeck.get_projects()
+
+        if not status:
+            return False, projects
+
+        try:
+            estimates = self._db.count_workflow_rows(get_cutoff_date(self._keep_time))
+        except Error as err:
+            return False, 'Error counting workflow rows: {0}'.format(err)
+
+        counters = self.__count(projects)
+        failures = [row[0] for row in counters if not row[1]]
+
+        if failures:
+            return False, 'Error returning executions counter of: {0}.'.format(', '.join(failures))
+
+        if not project_order:
+            status, jobs = self.__list_jobs(projects)
+
+            if not status:
+                return False, jobs
+
+            job_counters = self.__count(jobs, True)
+            failures = [row[0] for row in job_counters if not row[1]]
+
+            if failures:
+                return False, 'Error returning executions counter of jobs: {0}.'.format(', '.join(failures))
+
+            msg = 'Plan: {0} jobs, {1} of them with executions to delete.'.format(
+                len(jobs), len([row for row in job_counters if row[1] and row[2]]))
+            self._log.write(msg)
+
+        largest = max(counters, key=lambda row: row[2]) if counters else None
+        api_latency = self.__measure_count(largest[0]) if largest else 0
+        fetch_latency = self.__measure_fetch(largest[0]) if largest and largest[2] else api_latency
+        chunk_latency = fetch_latency + self._delete_latency
+        totals = [0, 0, 0, 0]
+
+        for proj, _, total in sorted(counters, key=lambda row: row[2], reverse=True):
+            if not total:
+                continue
+
+            workflows, steps = estimates.get(proj, (0, 0))
+            chunks = get_num_pages(total, self._chunk_size)
+            msg = '[{0}] plan: {1} executions, {2} workflows and {3} workflow steps in {4} chunks (~{5:.0f}s).'.format(
+                proj, total, workflows, steps, chunks, chunks * chunk_latency)
+            self._log.write(msg)
+
+            for index, counter in enumerate((total, workflows, steps, chunks)):
+                totals[index] += counter
+
+        msg = 'Plan statistics: {0} executions, {1} workflows and {2} workflow steps to delete in {3} chunks ' \
+              'of {4} executions.'.format(totals[0], totals[1], totals[2], totals[3], self._chunk_size)
+        self._log.write(msg)
+        msg = 'Plan statistics: {0:.3f}s per counter request, {1:.3f}s per page fetch, {2:.3f}s assumed per ' \
+              'bulk delete, ~{3:.0f}s projected cleanup time (planned in {4:.1f}s).'.format(
+                  api_latency, fetch_latency, self._delete_latency, totals[3] * chunk_latency, time() - start)
+        self._log.write(msg)
+
+        return True, ''
@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+
+from os import path, remove
+from time import sleep, time
+from mysql.connector import Error
+from .base import get_cutoff_date, get_log_files
+from .db import get_placeholders
+from .ids import IdBatch
+
+
+class DatabasePurge(object):
+    '''
+    This class deletes old executions data straight from Rundeck database, skipping
+    Rundeck API entirely.
+
+    Executions are walked in primary key ranges and each batch is removed from every
+    related table inside its own transaction, pausing between batches so replicas are
+    able to keep up. It is meant for first-time cleanups of large backlogs, where going
+    through the API a couple hundred executions at a time would take days.
+    '''
+
+    # Tables referencing executions which only exist in some Rundeck versions
+    DEPENDENT_TABLES = ('log_file_storage_request', 'referenced_execution')
+
+    # Workflows (w) in a range of IDs referenced neither by an execution nor by a job
+    ORPHAN_WORKFLOWS = 'LEFT JOIN execution e ON e.workflow_id = w.id ' \
+                       'LEFT JOIN scheduled_execution se ON se.workflow_id = w.id ' \
+                       'WHERE w.id >= %s AND w.id < %s AND e.id IS NULL AND se.id IS NULL'
+
+    # Steps (ws) in a range of IDs belonging to no workflow and handling errors of no step
+    ORPHAN_STEPS = 'LEFT JOIN workflow_workflow_step wws ON wws.workflow_step_id = ws.id ' \
+                   'LEFT JOIN workflow_step h ON h.error_handler_id = ws.id ' \
+                   'WHERE ws.id >= %s AND ws.id < %s AND wws.workflow_step_id IS NULL AND h.id IS NULL'
+
+    def __init__(self, db_conn, log, keep_time='30d', batch_size=1000, throttle=0.5, logs_dir=None):
+        '''Initialization of global variables'''
+        self._db = db_conn
+        self._log = log
+        self._keep_time = keep_time
+        self._batch_size = batch_size
+        self._throttle = throttle
+        self._logs_dir = logs_dir
+        self._dependents = []
+
+    def __get_dependent_tables(self):
+        '''Return which of the optional tables referencing executions exist'''
+        stmt = 'SELECT table_name FROM information_schema.tables ' \
+               'WHERE table_schema = DATABASE() AND table_name IN ({0})'.format(
+                   get_placeholders(len(self.DEPENDENT_TABLES)))
+
+        return [row[0] for row in self._db.query(stmt, self.DEPENDENT_TABLES).fetchall()]
+
+    def __get_bounds(self, cutoff, project=None):
+        '''Return lowest and highest IDs of executions older than the cutoff date'''
+        stmt = 'SELECT MIN(id), MAX(id) FROM execution WHERE date_completed < %s'
+        parameters = [cutoff]
+
+        if project:
+            stmt = '{0} AND project = %s'.format(stmt)
+            parameters.append(project)
+
+        return self._db.query(stmt, parameters).fetchall()[0]
+
+    def __get_batch(self, low, high, cutoff, project=None):
+        '''Return executions from a range of IDs which are older than the cutoff date'''
+        stmt = 'SELECT id, workflow_id, project, outputfilepath FROM execution ' \
+               'WHERE id >= %s AND id < %s AND date_completed < %s'
+        parameters = [low, high, cutoff]
+
+        if project:
+            stmt = '{0} AND project = %s'.format(stmt)
+            parameters.append(project)
+
+        return self._db.query('{0} ORDER BY id'.format(stmt), parameters).fetchall()
+
+    def __select_ids(self, stmt, ids):
+        '''Return the first column of a query filtered by a batch of IDs'''
+        selected = IdBatch()
+
+        for markers, parameters in ids.params():
+            query_res = self._db.query(stmt.format(markers), parameters)
+            selected.extend(int(row[0]) for row in query_res.fetchall() if row[0] is not None)
+
+        return selected
+
+    def __delete_ids(self, stmt, ids, text=False):
+        '''Run a statement filtered by a batch of IDs, bound as strings for text columns'''
+        for markers, parameters in ids.params(text=text):
+            self._db.query(stmt.format(markers), parameters)
+
+    def __delete_batch(self, executions):
+        '''Delete a batch of executions and their workflows in a single transaction'''
+        execution_ids = IdBatch(int(row[0]) for row in executions)
+        workflow_ids = IdBatch(int(row[1]) for row in executions if row[1] is not None)
+        step_ids = self.__select_ids(
+            'SELECT workflow_step_id FROM workflow_workflow_step WHERE workflow_commands_id IN ({0})',
+            workflow_ids)
+        n_steps = 0
+
+        self.__delete_ids('UPDATE execution SET retry_execution_id = NULL WHERE retry_execution_id IN ({0})',
+                          execution_ids)
+        # jc_exec_id is a VARCHAR, comparing it to integers would skip its index
+        self.__delete_ids('DELETE FROM base_report WHERE jc_exec_id IN ({0})', execution_ids, True)
+
+        for table in self._dependents:
+            self.__delete_ids('DELETE FROM ' + table + ' WHERE execution_id IN ({0})', execution_ids)
+
+        self.__delete_ids('DELETE FROM execution WHERE id IN ({0})', execution_ids)
+        self.__delete_ids('DELETE FROM workflow_workflow_step WHERE workflow_commands_id IN ({0})', workflow_ids)
+
+        # Steps may point to error handlers, which are steps as well and have to be
+        # deleted only after every step referencing them
+        while step_ids:
+            handler_ids = self.__select_ids(
+                'SELECT error_handler_id FROM workflow_step WHERE id IN ({0})', step_ids)
+            self.__delete_ids('DELETE FROM workflow_step WHERE id IN ({0})', step_ids)
+            n_steps += len(step_ids)
+            step_ids = handler_ids
+
+        self.__delete_ids('DELETE FROM workflow WHERE id IN ({0})', workflow_ids)
+        self._db.apply()
+
+        return len(execution_ids), len(workflow_ids), n_steps
+
+    def __delete_log_files(self, executions):
+        '''Remove log files of deleted executions, returning both number of files and bytes'''
+        n_files = 0
+        n_bytes = 0
+
+        for _, _, project, output_path in executions:
+            for log_file in get_log_files(self._logs_dir, project, output_path):
+                try:
+                    size = path.getsize(log_file)
+                    remove(log_file)
+                except OSError:
+                    continue
+
+                n_files += 1
+                n_bytes += size
+
+        return n_files, n_bytes
+
+    def purge(self, project=None):
+        '''Delete all executions older than a given time, batch by batch'''
+        cutoff = get_cutoff_date(self._keep_time)
+        stats = [0, 0, 0, 0, 0]
+        start = time()
+
+        try:
+            self._dependents = self.__get_dependent_tables()
+            low, high = self.__get_bounds(cutoff, project)
+        except Error as err:
+            return False, 'Error reading executions range: {0}'.format(err)
+
+        if low is None:
+            msg = 'No available executions for deleting older than {0}.'.format(cutoff)
+            self._log.write(msg)
+            return True, 0
+
+        msg = 'Purging executions older than {0} between IDs {1} and {2}.'.format(cutoff, low, high)
+        self._log.write(msg)
+
+        for batch_low in range(int(low), int(high) + 1, self._batch_size):
+            batch_high = batch_low + self._batch_size
+
+            try:
+                executions = self.__get_batch(batch_low, batch_high, cutoff, project)
+                if not executions:
+                    continue
+                counters = self.__delete_batch(executions)
+            except Error as err:
+                self._db.rollback()
+                return False, 'Error purging IDs {0} to {1}: {2}'.format(batch_low, batch_high, err)
+
+            if self._logs_dir:
+                counters += self.__delete_log_files(executions)
+
+            for index, counter in enumerate(counters):
+                stats[index] += counter
+
+            msg = 'Purged IDs {0} to {1}: {2} executions, {3} workflows and {4} workflow steps.'.format(
+                batch_low, batch_high, counters[0], counters[1], counters[2])
+            self._log.write(msg, 1)
+
+            if self._throttle:
+                sleep(self._throttle)
+
+        elapsed = time() - start
+        msg = 'Purge statistics: {0} executions, {1} workflows and {2} workflow steps deleted ' \
+              '({3:.1f} executions/sec).'.format(stats[0], stats[1], stats[2], stats[0] / max(elapsed, 1e-3))
+        self._log.write(msg)
+
+        if self._logs_dir:
+            msg = 'Purge statistics: {0} log files deleted ({1} bytes).'.format(stats[3], stats[4])
+            self._log.write(msg)
+
+        return True, stats[0]
+
+    def __sweep(self, table, statements, counters):
+        '''Run anti-join deletes over a table in ranges of IDs, one transaction per range'''
+        try:
+            low, high = self._db.query('SELECT MIN(id), MAX(id) FROM {0}'.format(table)).fetchall()[0]
+        except Error as err:
+            return False, 'Error reading {0} range: {1}'.format(table, err)
+
+        if low is None:
+            return True, ''
+
+        for batch_low in range(int(low), int(high) + 1, self._batch_size):
+            batch_high = min(batch_low + self._batch_size, int(high) + 1)
+            deleted = 0
+
+            try:
+                for index, stmt in enumerate(statements):
+                    n_rows = self._db.query(stmt, (batch_low, batch_high)).rowcount
+                    counters[index] += max(n_rows, 0)
+                    deleted += max(n_rows, 0)
+                self._db.apply()
+            except Error as err:
+                self._db.rollback()
+                return False, 'Error reconciling {0} IDs {1} to {2}: {3}'.format(table, batch_low, batch_high, err)
+
+            if deleted:
+                msg = 'Reconciled {0} IDs {1} to {2}: {3} orphaned rows deleted.'.format(
+                    table, batch_low, batch_high, deleted)
+                self._log.write(msg, 1)
+
+                if self._throttle:
+                    sleep(self._throttle)
+
+        return True, ''
+
+    def reconcile(self):
+        '''Delete workflow rows no longer referenced by any execution or job'''
+        workflow_counters = [0, 0]
+        start = time()
+
+        status, msg = self.__sweep('workflow', [
+            'DELETE wws FROM workflow_workflow_step wws JOIN workflow w ON w.id = wws.workflow_commands_id '
+            + self.ORPHAN_WORKFLOWS,
+            'DELETE w FROM workflow w ' + self.ORPHAN_WORKFLOWS
+        ], workflow_counters)
+
+        if not status:
+            return False, msg
+
+        # Error handlers only become orphaned once the steps pointing to them are gone, so
+        # sweep steps again as long as the previous sweep found something
+        n_steps = 0
+        step_counters = [1]
+
+        while step_counters[0]:
+            step_counters = [0]
+            status, msg = self.__sweep('workflow_step', ['DELETE ws FROM workflow_step ws ' + self.ORPHAN_STEPS],
+                                       step_counters)
+
+            if not status:
+                return False, msg
+
+            n_steps += step_counters[0]
+
+        elapsed = time() - start
+        n_rows = sum(workflow_counters) + n_steps
+        msg = 'Reconcile statistics: {0} workflows, {1} workflow-step links and {2} workflow steps deleted ' \
+              '({3:.1f} rows/sec).'.format(workflow_counters[1], workflow_counters[0], n_steps,
+                                          n_rows / max(elapsed, 1e-3))
+        self._log.write(msg)
+
+        return True, n_rows
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+from concurrent.futures import ThreadPoolExecutor
+from os import remove, scandir
+from time import mktime, time
+from mysql.connector import Error
+from .base import LOG_EXTENSIONS, get_cutoff_date
+
+# Files modified more recently than this (in seconds) are left alone, as their
+# execution may not be visible in database yet
+MIN_AGE = 3600
+
+
+class LogReaper(object):
+    '''
+    This class removes execution log files from Rundeck logs directory, instead of
+    leaving it to Rundeck API, which deletes them one by one within each bulk delete.
+
+    The directory tree is walked with os.scandir, and execution IDs found in file
+    names are checked against the database a batch at a time. Files of executions
+    which no longer exist (orphans), and optionally files older than keep_time
+    (expired), are removed by a pool of workers.
+    '''
+
+    def __init__(self, db_conn, log, logs_dir, keep_time='30d', batch_size=1000, workers=4, expired=False):
+        '''Initialization of global variables'''
+        self._db = db_conn
+        self._log = log
+        self._logs_dir = logs_dir
+        self._keep_time = keep_time
+        self._batch_size = batch_size
+        self._workers = workers
+        self._expired = expired
+
+    def __walk(self):
+        '''Yield (execution ID, path, size, modification time) of every log file'''
+        directories = [self._logs_dir]
+
+        while directories:
+            try:
+                entries = scandir(directories.pop())
+            except OSError:
+                continue
+
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                        continue
+
+                    for extension in LOG_EXTENSIONS:
+                        exec_id = entry.name[:-len(extension)]
+
+                        if entry.name.endswith(extension) and exec_id.isdigit():
+                            try:
+                                stat = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                break
+
+                            yield int(exec_id), entry.path, stat.st_size, stat.st_mtime
+                            break
+
+    @staticmethod
+    def __unlink(log_file):
+        '''Remove a file, returning its size or None if it could not be removed'''
+        file_path, size = log_file
+
+        try:
+            remove(file_path)
+        except OSError:
+            return None
+
+        return size
+
+    def __reap_batch(self, pool, batch, expired_time, stats):
+        '''Remove files of a batch which belong to no execution, or which expired'''
+        existing = set(self._db.get_existing_executions(list(set(row[0] for row in batch))))
+        victims = []
+
+        # End the read transaction, otherwise every batch would be checked against the
+        # REPEATABLE READ snapshot of the first one and miss executions deleted since
+        self._db.rollback()
+
+        for exec_id, file_path, size, mtime in batch:
+            if exec_id not in existing:
+                stats['orphans'] += 1
+                victims.append((file_path, size))
+            elif self._expired and mtime < expired_time:
+                stats['expired'] += 1
+                victims.append((file_path, size))
+
+        for size in pool.map(self.__unlink, victims):
+            if size is None:
+                stats['errors'] += 1
+            else:
+                stats['files'] += 1
+                stats['bytes'] += size
+
+    def reap(self):
+        '''Walk logs directory, removing orphan (and optionally expired) log files'''
+        start = time()
+        recent_time = start - MIN_AGE
+        expired_time = mktime(get_cutoff_date(self._keep_time).timetuple())
+        stats = dict((name, 0) for name in ('scanned', 'orphans', 'expired', 'files', 'bytes', 'errors'))
+        batch = []
+
+        msg = 'Reaping log files from {0}{1}.'.format(
+            self._logs_dir, ' (and those older than {0})'.format(self._keep_time) if self._expired else '')
+        self._log.write(msg)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as pool:
+                for log_file in self.__walk():
+                    stats['scanned'] += 1
+
+                    if log_file[3] > recent_time:
+                        continue
+
+                    batch.append(log_file)
+
+                    if len(batch) >= self._batch_size:
+                        self.__reap_batch(pool, batch, expired_time, stats)
+                        batch = []
+
+                        msg = 'Reaped so far: {0} of {1} files scanned ({2} bytes).'.format(
+                            stats['files'], stats['scanned'], stats['bytes'])
+                        self._log.write(msg, 1)
+
+                if batch:
+                    self.__reap_batch(pool, batch, expired_time, stats)
+        except Error as err:
+            return False, 'Error checking executions of log files: {0}'.format(err)
+
+        elapsed = time() - start
+        msg = 'Reap statistics: {0} files scanned, {1} orphan and {2} expired, {3} files deleted ({4} bytes, ' \
+              '{5} errors) in {6:.1f}s ({7:.1f} files/sec).'.format(
+                  stats['scanned'], stats['orphans'], stats['expired'], stats['files'], stats['bytes'],
+                  stats['errors'], elapsed, stats['scanned'] / max(elapsed, 1e-3))
+        self._log.write(msg)
+
+        return True, stats['files']
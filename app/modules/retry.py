@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+import threading
+
+from random import uniform
+from time import sleep, time
+
+
+class RetryPolicy(object):
+    '''
+    This class decides how failed deletes are retried, across every chunk of a run.
+
+    Delays grow exponentially from the given backoff (up to max_delay), with a random
+    jitter so concurrent workers don't retry in lockstep. Retries are taken from a
+    budget shared by the whole run (0 means unbounded), so a flapping Rundeck can't
+    keep a run retrying forever. After breaker_threshold consecutive failed requests
+    (0 disables it), the circuit opens: every worker holds its requests for
+    breaker_cooldown seconds, then a single trial request decides whether it closes
+    again or stays open for another cooldown.
+    '''
+
+    def __init__(self, budget=200, max_delay=300, breaker_threshold=5, breaker_cooldown=60):
+        '''Initialization of global variables'''
+        self._budget = budget
+        self._max_delay = max_delay
+        self._threshold = breaker_threshold
+        self._cooldown = breaker_cooldown
+        self._lock = threading.Lock()
+        self._used = 0
+        self._failures = 0
+        self._opened = None
+        self._trial = False
+
+    @property
+    def used(self):
+        '''Number of retries taken from the budget so far'''
+        return self._used
+
+    def delay(self, backoff, attempt):
+        '''Return how long to wait before a retry, the first one being attempt 0'''
+        ceiling = min(backoff * 2 ** attempt, self._max_delay)
+
+        return uniform(ceiling / 2.0, ceiling)
+
+    def acquire(self):
+        '''Take a retry from the budget, returning False once it is spent'''
+        with self._lock:
+            if self._budget and self._used >= self._budget:
+                return False
+
+            self._used += 1
+
+            return True
+
+    def record(self, success):
+        '''Account the result of a request, opening or closing the circuit'''
+        with self._lock:
+            self._trial = False
+
+            if success:
+                self._failures = 0
+                self._opened = None
+                return
+
+            self._failures += 1
+
+            if self._threshold and self._failures >= self._threshold:
+                self._opened = time()
+
+    def wait(self):
+        '''Block while the circuit is open, returning how long it waited'''
+        start = time()
+
+        while True:
+            with self._lock:
+                if self._opened is None:
+                    break
+
+                remaining = self._opened + self._cooldown - time()
+
+                # Once cooled down, let a single request through to probe Rundeck
+                if remaining <= 0 and not self._trial:
+                    self._trial = True
+                    break
+
+            sleep(max(remaining, 1))
+
+        return time() - start
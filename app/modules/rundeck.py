@@ -1,9 +1,24 @@
 #!/usr/bin/python
 
-from json import dumps
-from time import sleep
-from requests import get, post, exceptions
-from .base import get_num_pages
+import threading
+
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from queue import Queue, Full
+from time import gmtime, sleep, strftime, time
+from requests import Session, exceptions
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .adaptive import ChunkController
+from .base import get_cutoff_date, get_num_pages
+from .ids import IdBatch, get_failed_executions
+from .metrics import Metrics
+from .retry import RetryPolicy
+from .stream import iter_json_items
+
+# Bytes read at once from streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 class RundeckApi(object):
@@ -15,7 +30,9 @@ class RundeckApi(object):
     and complements deleting executions' data from workflow tables.
     '''
 
-    def __init__(self, url, headers, db_conn, log, chunk_size=200, keep_time='30d', ssl=False, search_time=60, del_time=300):
+    def __init__(self, url, headers, db_conn, log, chunk_size=200, keep_time='30d', ssl=False, search_time=60, del_time=300,
+                 pool_size=10, keep_alive=True, http_retries=3, prefetch=2, chunker=None, journal=None,
+                 metrics=None, throttle=None, catalog=None, archive=None, retry=None):
         '''Initialization of global variables'''
         self._url = url
         self._headers = headers
@@ -26,8 +43,67 @@ class RundeckApi(object):
         self._check_ssl = ssl
         self._search_time = search_time
         self._del_time = del_time
+        self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        self._http_retries = http_retries
+        self._prefetch = prefetch
+        self._chunker = chunker if chunker else ChunkController(chunk_size)
+        self._journal = journal
+        self._metrics = metrics if metrics else Metrics()
+        self._throttle = throttle
+        self._catalog = catalog
+        self._archive = archive
+        self._retry = retry if retry else RetryPolicy()
+        self._begin = None
+        self._budget = None
+        self._session = self.__new_session()
+
+    def __new_session(self):
+        '''Create a connection-pooled HTTP session shared by all requests of this client'''
+        retry_opts = {
+            'total': self._http_retries,
+            'connect': self._http_retries,
+            'read': self._http_retries,
+            'status': self._http_retries,
+            'backoff_factor': 0.5,
+            'status_forcelist': (502, 503, 504),
+            'raise_on_status': False
+        }
+
+        # Only idempotent requests are retried on read errors or bad statuses, connection
+        # errors are retried for every method since nothing has reached the server yet
+        try:
+            retry = Retry(allowed_methods=frozenset(['GET']), **retry_opts)
+        except TypeError:
+            retry = Retry(method_whitelist=frozenset(['GET']), **retry_opts)
+
+        adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size,
+                              max_retries=retry)
+
+        session = Session()
+        session.headers.update(self._headers)
+        session.verify = self._check_ssl
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        if not self._keep_alive:
+            session.headers['Connection'] = 'close'
 
-    def __get(self, endpoint, parameters=''):
+        return session
+
+    def set_pass(self, begin=None, budget=None):
+        '''
+        Restrict cleanups to executions completed after a date (ISO 8601, UTC) and bound
+        them by a budget, which is checked before each chunk, as daemon passes do
+        '''
+        self._begin = begin
+        self._budget = budget
+
+    def close(self):
+        '''Release all pooled HTTP connections'''
+        self._session.close()
+
+    def __get(self, endpoint, parameters='', stream=False):
         '''GET requests in Rundeck API endpoints'''
         status = False
         data = ''
@@ -38,8 +114,8 @@ class RundeckApi(object):
             return status, data
 
         try:
-            response = get(endpoint, params=parameters, headers=self._headers,
-                           verify=self._check_ssl, timeout=self._search_time)
+            response = self._session.get(endpoint, params=parameters, timeout=self._search_time,
+                                         stream=stream)
             if response.ok:
                 status = True
                 data = response
@@ -47,6 +123,7 @@ class RundeckApi(object):
                 status = False
                 data = 'Failing accessing API endpoint with http code: {0}'.format(
                     response.status_code)
+                response.close()
         except exceptions.RequestException as exception:
             data = exception
 
@@ -63,8 +140,7 @@ class RundeckApi(object):
             return status, data
 
         try:
-            response = post(endpoint, data=parameters, headers=self._headers,
-                            verify=self._check_ssl, timeout=self._del_time)
+            response = self._session.post(endpoint, data=parameters, timeout=self._del_time)
             if response.ok:
                 status = True
                 data = response
@@ -77,41 +153,123 @@ class RundeckApi(object):
 
         return status, data
 
-    def __delete_executions_data(self, identifier, executions, page, retries=5, backoff=5, unoptimized=False):
-        '''Private function to delete both executions and workflows'''
-        n_retries = 0
-        interval = [page * self._chunk_size, page * self._chunk_size + len(executions)]
+    def __delete_executions_data(self, identifier, executions, offset, retries=5, backoff=5, unoptimized=False):
+        '''
+        Private function to delete both executions and workflows. Workflows are looked up
+        once, and each retry only covers executions which Rundeck failed to delete, and
+        workflows whose deletion failed
+        '''
+        from mysql.connector import Error
+
+        attempt = 0
+        executions = IdBatch.of(executions)
+        interval = [offset, offset + len(executions)]
         msg = '[{0}]: Deleting range {1} to {2}'.format(identifier, interval[0], interval[1])
         self._log.write(msg)
 
-        for _ in range(0, retries):
-            n_retries += 1
-            workflows, steps, err_wf = self.get_workflow_ids(executions)
+        # Executions are recorded once, before any attempt to delete them
+        if self._archive:
+            with self._metrics.timer('archive', identifier):
+                status, err_msg = self.archive_executions(executions)
 
-            if not workflows or not steps:
-                return False, err_wf
-
-            msg = '[{0}] Removing following executions -> {1}'.format(identifier, executions)
-            self._log.write(msg, 1)
-            msg = '[{0}] Removing following workflows -> {1}'.format(identifier, workflows)
-            self._log.write(msg, 1)
-            msg = '[{0}] Removing following workflow steps -> {1}'.format(identifier, steps)
-            self._log.write(msg, 1)
+            if not status:
+                self._metrics.incr('failures', 1, identifier)
+                return False, '[{0}]: {1}'.format(identifier, err_msg)
 
-            status_exec, _ = self.delete_executions(executions)
-            status_wf, _ = self.delete_workflows(workflows, steps, unoptimized)
+        if self._throttle:
+            self._throttle.wait(identifier)
 
-            if status_exec and status_wf:
+        try:
+            with self._metrics.timer('lookup', identifier):
+                mapping = self._db.get_workflows_by_execution(executions)
+        except Error as err:
+            self._metrics.incr('failures', 1, identifier)
+            return False, '[{0}]: Error looking up workflows: {1}'.format(identifier, err)
+
+        if not mapping:
+            self._metrics.incr('failures', 1, identifier)
+            return False, '[{0}]: No workflows found for executions.'.format(identifier)
+
+        workflows = IdBatch(OrderedDict((entry[0], None) for entry in mapping.values()))
+        steps = IdBatch(step for entry in mapping.values() for step in entry[1])
+
+        if self._journal:
+            key = self._journal.add_pending(identifier, executions, workflows, steps)
+
+        msg = '[{0}] Removing {1} executions ({2}), {3} workflows and {4} workflow steps.'.format(
+            identifier, len(executions), executions.summary(), len(workflows), len(steps))
+        self._log.write(msg, 1)
+
+        pending = executions
+        orphans = IdBatch()
+
+        while True:
+            if pending:
+                with self._metrics.timer('breaker', identifier):
+                    self._retry.wait()
+
+                start = time()
+                status_exec, failed = self.delete_executions(pending)
+                latency = time() - start
+                self._metrics.observe('api_delete', latency, identifier)
+                self._chunker.update(len(pending), latency, status_exec)
+                self._retry.record(len(failed) < len(pending))
+
+                if self._throttle:
+                    self._throttle.observe(latency, status_exec)
+
+                failed = set(failed)
+                deleted = IdBatch(exec_id for exec_id in pending if exec_id not in failed)
+                orphans.extend(deleted)
+                pending = IdBatch(exec_id for exec_id in pending if exec_id in failed)
+
+                self._metrics.incr('executions_deleted', len(deleted), identifier)
+                if self._budget:
+                    self._budget.consume(len(deleted))
+
+            # Workflows can only go once their executions are gone
+            if orphans:
+                orphan_workflows = IdBatch(mapping[exec_id][0] for exec_id in orphans if exec_id in mapping)
+                orphan_steps = IdBatch(step for exec_id in orphans if exec_id in mapping
+                                       for step in mapping[exec_id][1])
+
+                try:
+                    with self._metrics.timer('db_delete', identifier):
+                        self.delete_workflows(orphan_workflows, orphan_steps, unoptimized, False)
+
+                    with self._metrics.timer('commit', identifier):
+                        self._db.apply()
+
+                    orphans = IdBatch()
+                except Error as err:
+                    self._db.rollback()
+                    msg = '[{0}]: Error deleting workflows: {1}'.format(identifier, err)
+                    self._log.write(msg, 3)
+
+            if not pending and not orphans:
+                if self._journal:
+                    self._journal.done_pending(key)
                 break
-            elif not (status_exec or status_wf) and n_retries <= retries:
-                sleep(backoff)
-                msg = '[{0}] #{1} try not succeeded. Trying again in {2} seconds.'.format(identifier, retries, backoff)
-                self._log.write(msg, 1)
-                continue
-            else:
-                msg = '[{0}]: Error deleting executions.'.format(identifier)
+
+            if attempt + 1 >= retries or not self._retry.acquire():
+                self._metrics.incr('failures', 1, identifier)
+                msg = '[{0}]: Error deleting {1} executions and workflows of {2} executions.'.format(
+                    identifier, len(pending), len(orphans))
                 return False, msg
 
+            delay = self._retry.delay(backoff, attempt)
+            attempt += 1
+            self._metrics.incr('retries', 1, identifier)
+            msg = '[{0}] #{1} try not succeeded ({2} executions and workflows of {3} executions left). ' \
+                  'Trying again in {4:.1f} seconds.'.format(identifier, attempt, len(pending), len(orphans), delay)
+            self._log.write(msg, 1)
+
+            with self._metrics.timer('retry_sleep', identifier):
+                sleep(delay)
+
+            if self._throttle:
+                self._throttle.wait(identifier)
+
         return True, ''
 
     def parse_json_response(self, response, filter_by='', appender=''):
@@ -142,11 +300,20 @@ class RundeckApi(object):
         status = False
         data = ''
 
+        if only_names and self._catalog:
+            data = self._catalog.get('projects')
+
+            if data is not None:
+                return True, data
+
         status, response = self.__get(endpoint)
 
         if only_names and status:
             status = True
             data = self.parse_json_response(response, None, 'name')
+
+            if data is not False and self._catalog:
+                self._catalog.put('projects', data)
         elif status and not only_names:
             status = True
             data = self.parse_json_response(response)
@@ -154,7 +321,8 @@ class RundeckApi(object):
             status = False
             data = response
 
-        if not data:
+        if data is False:
+            status = False
             data = 'Error parsing JSON response.'
 
         return status, data
@@ -162,14 +330,24 @@ class RundeckApi(object):
     def get_jobs_by_project(self, project_name, only_ids=True):
         '''Retrieve info about all jobs by project'''
         endpoint = '{0}/project/{1}/jobs'.format(self._url, project_name)
+        key = 'jobs:{0}'.format(project_name)
         status = False
         data = ''
 
+        if only_ids and self._catalog:
+            data = self._catalog.get(key)
+
+            if data is not None:
+                return True, data
+
         status, response = self.__get(endpoint)
 
         if only_ids and status:
             status = True
             data = self.parse_json_response(response, None, 'id')
+
+            if data is not False and self._catalog:
+                self._catalog.put(key, data)
         elif status and not only_ids:
             status = True
             data = self.parse_json_response(response)
@@ -177,30 +355,37 @@ class RundeckApi(object):
             status = False
             data = response
 
-        if not data:
+        if data is False:
+            status = False
             data = 'Error parsing JSON response.'
 
         return status, data
 
-    def get_executions(self, identifier, page, jobs=True, only_ids=True, running=False):
-        '''Get executions older than a given number of days by job or project'''
+    def get_executions(self, identifier, page, jobs=True, only_ids=True, running=False, size=None, job=None):
+        '''Get executions older than a given number of days by job or project (optionally of one of its jobs)'''
 
         status = False
         search_type = 'job' if jobs else 'project'
         endpoint = '{0}/{1}/{2}/executions'.format(
             self._url, search_type, identifier)
+        size = size if size else self._chunk_size
 
         if jobs:
             parameters = {
-                'max': self._chunk_size,
+                'max': size,
                 'offset': page * self._chunk_size,
             }
         else:
             parameters = {
-                'max': self._chunk_size,
+                'max': size,
                 'olderFilter': str(self._keep_time)
             }
 
+            if self._begin:
+                parameters['begin'] = self._begin
+            if job:
+                parameters['jobIdListFilter'] = job
+
         if running:
             endpoint = '{0}/running'.format(endpoint)
 
@@ -221,205 +406,602 @@ class RundeckApi(object):
 
         return status, data
 
-    def get_total_executions(self, identifier, jobs=True):
-        '''Get executions counter by project or job'''
+    def __stream_executions(self, endpoint, parameters, only_ids=True):
+        '''Return a generator of executions decoded while the response body is downloaded'''
+        status, response = self.__get(endpoint, parameters, True)
+
+        if not status:
+            return False, response
+
+        def executions():
+            '''Generator releasing the connection once the body is consumed'''
+            try:
+                for execution in iter_json_items(response.iter_content(STREAM_CHUNK_SIZE), 'executions',
+                                                 'id' if only_ids else ''):
+                    yield execution
+            finally:
+                response.close()
+
+        return True, executions()
+
+    def iter_executions(self, identifier, jobs=True, only_ids=True, running=False, size=None):
+        '''
+        Same as get_executions (first page), but executions are yielded one by one while
+        the response body is still being downloaded, so memory stays flat regardless of
+        the page size
+        '''
+        search_type = 'job' if jobs else 'project'
+        endpoint = '{0}/{1}/{2}/executions'.format(self._url, search_type, identifier)
+        parameters = {
+            'max': size if size else self._chunk_size
+        }
+
+        if not jobs:
+            parameters['olderFilter'] = str(self._keep_time)
+
+            if self._begin:
+                parameters['begin'] = self._begin
+
+        if running:
+            endpoint = '{0}/running'.format(endpoint)
+
+        return self.__stream_executions(endpoint, parameters, only_ids)
+
+    def get_job_project(self, job):
+        '''Return the name of the project a job belongs to'''
+        endpoint = '{0}/job/{1}/info'.format(self._url, job)
+        key = 'job:{0}'.format(job)
+        data = self._catalog.get(key) if self._catalog else None
+
+        if data is not None:
+            return True, data
+
+        status, response = self.__get(endpoint)
+
+        if not status:
+            return False, response
+
+        data = self.parse_json_response(response, None, 'project')
+
+        if not data:
+            return False, 'Error parsing JSON response.'
+
+        if self._catalog:
+            self._catalog.put(key, data)
+
+        return True, data
+
+    def iter_all_executions(self, project, job=None, size=None):
+        '''
+        Yield every execution of a project (or one of its jobs), newest first.
+
+        Pages are bounded by completion date (keyset) instead of a growing offset, which
+        Rundeck would have to scan past on every page. The offset only skips executions
+        already seen which completed in the same second as the last one.
+        '''
+        endpoint = '{0}/project/{1}/executions'.format(self._url, project)
+        size = size if size else self._chunk_size
+        end, offset = None, 0
+
+        while True:
+            parameters = {'max': size, 'offset': offset}
+
+            # Dates only go down to seconds, so bound by the next second in order to still
+            # get every execution completed in the same second as the last one seen
+            if end is not None:
+                parameters['end'] = strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(end + 1))
+            if job:
+                parameters['jobIdListFilter'] = job
+
+            status, executions = self.__stream_executions(endpoint, parameters, False)
+
+            if not status:
+                raise IOError('[{0}]: Error getting executions: {1}'.format(project, executions))
+
+            n_executions = 0
+
+            for execution in executions:
+                n_executions += 1
+                ended = execution.get('date-ended', {}).get('unixtime')
+                ended = ended // 1000 if ended else None
+
+                if ended is None:
+                    offset += 1
+                elif ended == end:
+                    offset += 1
+                else:
+                    end, offset = ended, 1
+
+                yield execution
+
+            if n_executions < size:
+                return
+
+    def get_total_executions(self, identifier, jobs=True, cached=False, project=None):
+        '''
+        Get executions counter by project or job. Counters are kept in the catalog, but
+        they are only read from it when cached is set, as they go stale quickly
+        '''
 
         status = False
         search_type = 'job' if jobs else 'project'
         endpoint = '{0}/{1}/{2}/executions'.format(
             self._url, search_type, identifier)
+        key = 'total:{0}:{1}:{2}'.format(self._keep_time, search_type, identifier)
+
+        if cached and self._catalog and not self._begin:
+            data = self._catalog.get(key)
+
+            if data is not None:
+                return True, data
+
         parameters = {
             'olderFilter': str(self._keep_time),
             'max': 1
         }
 
+        # Executions endpoint of jobs ignores olderFilter, so count them from their project
+        if jobs and project:
+            endpoint = '{0}/project/{1}/executions'.format(self._url, project)
+            parameters['jobIdListFilter'] = identifier
+
+        if self._begin:
+            parameters['begin'] = self._begin
+
         status, response = self.__get(endpoint, parameters)
 
         if status:
             status = True
             data = self.parse_json_response(response, 'paging', 'total')
+
+            if data is not False and self._catalog and not self._begin:
+                self._catalog.put(key, data)
         else:
             status = False
             data = response if response else 'Error parsing JSON response.'
 
         return status, data
 
-    def get_workflow_ids(self, executions_ids):
-        '''Return IDs from workflow and related tables'''
-        self._db.open()
-
-        # Convert execution list to a comma-separated string
-        executions_ids = ','.join(map(str, executions_ids))
-        workflow_ids = ''
-        workflow_step_ids = ''
+    def archive_executions(self, executions_ids):
+        '''Append a record of each execution to the archive'''
+        from mysql.connector import Error
 
-        # Return workflow IDs
-        workflow_stmt = 'SELECT workflow_id FROM execution WHERE id IN ({0})'.format(
-            executions_ids)
-        query_res = self._db.query(workflow_stmt)
+        try:
+            self._archive.write(self._db.get_execution_records(executions_ids))
+        except (Error, IOError, OSError) as err:
+            return False, 'Error archiving executions: {0}'.format(err)
 
-        for workflow_id in query_res:
-            workflow_ids = '{0},{1}'.format(workflow_ids, str(workflow_id[0]))
+        return True, ''
 
-        workflow_ids = workflow_ids.strip(',')
+    def delete_executions(self, executions_ids):
+        '''Bulk deletions of Rundeck executions, returning which of them could not be deleted'''
 
-        # Return workflow step IDs
-        if workflow_ids:
-            workflow_step_stmt = 'SELECT workflow_step_id FROM workflow_workflow_step WHERE workflow_commands_id IN ({0})'.format(
-                workflow_ids)
-            query_res = self._db.query(workflow_step_stmt)
+        endpoint = '{0}/executions/delete'.format(self._url)
+        executions_ids = IdBatch.of(executions_ids)
+        data = executions_ids.to_json()
+        status = False
 
-            for workflow_step_id in query_res:
-                workflow_step_ids = '{0},{1}'.format(workflow_step_ids, str(workflow_step_id[0]))
+        status, response = self.__post(endpoint, data)
 
-            workflow_step_ids = workflow_step_ids.strip(',')
+        if not status:
+            return False, executions_ids
 
-        self._db.close()
+        return get_failed_executions(executions_ids, self.parse_json_response(response))
 
-        return workflow_ids, workflow_step_ids, ''
+    def delete_workflows(self, workflow_ids, workflow_step_ids, unoptimized=False, commit=True):
+        '''Bulk deletions of Rundeck workflow tables'''
+        self._db.delete_workflows(workflow_ids, workflow_step_ids, unoptimized, commit)
 
-    def delete_executions(self, executions_ids):
-        '''Bulk deletions of Rundeck executions'''
+        return True, ''
 
-        endpoint = '{0}/executions/delete'.format(self._url)
-        data = dumps(executions_ids)
-        status = False
-        msg = ''
+    def __prefetch_executions(self, project, total, state, page_queue, job=None):
+        '''Producer: keep a bounded queue filled with the next pages of execution IDs'''
+        lock, seen, done, stop = state
+        identifier = job if job else project
+
+        def put(item):
+            '''Block on the bounded queue, giving up if the consumer has stopped'''
+            while not stop.is_set():
+                try:
+                    page_queue.put(item, timeout=1)
+                    return True
+                except Full:
+                    continue
+            return False
 
-        status, response = self.__post(endpoint, data)
+        offset = 0
+        error = False
 
-        if status:
-            all_succeeded = self.parse_json_response(response, 'allsuccessful')
-            if all_succeeded:
-                status = True
-            else:
-                status = False
+        # Whatever happens, the consumer must get either an error item or the end of
+        # pages, otherwise it would wait forever on the queue
+        try:
+            while offset < total:
+                size = self._chunker.size
+
+                # Chunks deleted before this fetch can't show up in its page, so their IDs can
+                # be forgotten, which keeps both sets as small as the executions in flight
+                with lock:
+                    for executions in done:
+                        seen.difference_update(executions)
+                    del done[:]
+                    in_flight = len(seen)
+
+                # Deleting by olderFilter always re-queries the first page, so ask for enough
+                # rows to step over every execution which is still queued or being deleted
+                with self._metrics.timer('fetch', identifier):
+                    status, executions = self.get_executions(project, 0, False, size=size + in_flight, job=job)
 
-        return status, msg
+                if not status:
+                    error = True
+                    break
+
+                executions = executions if isinstance(executions, list) else []
+
+                with lock:
+                    executions = IdBatch(ex for ex in executions if ex not in seen)[:size]
+                    seen.update(executions)
+
+                if not executions or not put((offset, executions)):
+                    break
+
+                offset += len(executions)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            put((offset, None) if error else (None, None))
+
+    def __pipeline_executions(self, project, total, retries=5, backoff=5, unoptimized=False, job=None):
+        '''Delete executions of a project (or one of its jobs) while the next pages are being fetched'''
+        identifier = job if job else project
+        state = (threading.Lock(), set(), [], threading.Event())
+        lock, _, done, stop = state
+        page_queue = Queue(maxsize=self._prefetch)
+        producer = threading.Thread(target=self.__prefetch_executions,
+                                    args=(project, total, state, page_queue, job))
+        producer.daemon = True
+        producer.start()
+
+        status, msg = True, ''
+
+        while True:
+            offset, executions = page_queue.get()
+
+            if offset is None or (self._budget and self._budget.exhausted()):
+                break
+            elif executions is None:
+                status, msg = False, '[{0}]: Error getting executions.'.format(identifier)
+                break
 
-    def delete_workflows(self, workflow_ids, workflow_step_ids, unoptimized=False):
-        '''Bulk deletions of Rundeck workflow tables'''
-        self._db.open()
+            success, err_msg = self.__delete_executions_data(identifier, executions, offset, retries, backoff,
+                                                             unoptimized)
 
-        if workflow_ids and unoptimized:
-            work_workflow_delete = 'DELETE FROM workflow_workflow_step WHERE workflow_commands_id IN ({0})'.format(
-                workflow_ids)
-            self._db.query(work_workflow_delete)
+            if not success:
+                status, msg = False, err_msg
+                break
 
-        if workflow_step_ids:
-            workflow_step_delete = 'DELETE FROM workflow_step WHERE id IN ({0})'.format(
-                workflow_step_ids)
-            self._db.query(workflow_step_delete)
+            with lock:
+                done.append(executions)
 
-        if workflow_ids:
-            workflow_delete = 'DELETE FROM workflow WHERE id IN ({0})'.format(
-                workflow_ids)
-            self._db.query(workflow_delete)
+        stop.set()
+        producer.join()
 
-        self._db.apply()
-        self._db.close()
+        return status, msg
 
-        return True, ''
+    def clean_project_executions(self, project, retries=5, backoff=5, unoptimized=False, total=None, job=None):
+        '''
+        Clean executions older than a given time from a project, or only those of one of its
+        jobs, unless its counter is already known. Pages are always the first one of old
+        executions, which moves forward as executions are deleted
+        '''
+        identifier = job if job else project
+        status = True
 
-    def clean_project_executions(self, project, retries=5, backoff=5, unoptimized=False):
-        '''Clean executions older than a given time by from a project'''
-        status, total = self.get_total_executions(project, False)
+        if total is None:
+            status, total = self.get_total_executions(identifier, bool(job), project=project)
         pages = 0
 
         if not status:
-            msg = "[{0}]: Error returning executions counter.".format(project)
+            msg = "[{0}]: Error returning executions counter.".format(identifier)
             return False, msg
         else:
             if total > 0:
-                msg = "[{0}]: There are {1} executions to delete.".format(project, total)
+                msg = "[{0}]: There are {1} executions to delete.".format(identifier, total)
                 self._log.write(msg)
-                pages = get_num_pages(total, self._chunk_size)
+                pages = get_num_pages(total, self._chunker.size)
                 msg = "Processing deleting in {0} cycles.".format(pages)
                 self._log.write(msg)
             else:
-                msg = "[{0}]: No available executions for deleting.".format(project)
+                msg = "[{0}]: No available executions for deleting.".format(identifier)
                 self._log.write(msg)
 
-            for page in range(0, pages):
-                status, executions = self.get_executions(project, page, False)
+            if self._prefetch > 0:
+                status, msg = self.__pipeline_executions(project, total, retries, backoff, unoptimized, job)
+                if not status:
+                    return False, msg
+
+                return True, total
+
+            offset = 0
+
+            while offset < total and not (self._budget and self._budget.exhausted()):
+                with self._metrics.timer('fetch', identifier):
+                    status, executions = self.get_executions(project, 0, False, size=self._chunker.size, job=job)
 
-                if status:
-                    success, msg = self.__delete_executions_data(project, executions, page, retries, backoff, unoptimized)
+                if status and not isinstance(executions, list):
+                    break
+                elif status:
+                    success, msg = self.__delete_executions_data(identifier, executions, offset, retries, backoff,
+                                                                 unoptimized)
 
                     if not success:
                         return False, msg
+
+                    offset += len(executions)
                 else:
-                    msg = '[{0}]: Error getting executions.'.format(project)
+                    msg = '[{0}]: Error getting executions.'.format(identifier)
                     return False, msg
 
         return True, total
 
-    def clean_job_executions(self, job, retries=5, backoff=5, unoptimized=False):
-        '''...'''
-        status, total = self.get_total_executions(job)
-        pages = 0
+    def clean_job_executions(self, project, job, retries=5, backoff=5, unoptimized=False, total=None):
+        '''
+        Clean executions older than a given time from a job. They are requested from its
+        project, filtered by job, as executions endpoint of jobs does not filter by age
+        '''
+        return self.clean_project_executions(project, retries, backoff, unoptimized, total, job)
 
-        if not status:
-            msg = "[{0}]: Error returning executions counter.".format(job)
-            return False, msg
-        else:
-            if total > 0:
-                msg = "[{0}]: There are {1} executions to delete.".format(job, total)
-                self._log.write(msg)
-                pages = get_num_pages(total, self._chunk_size)
-                msg = "Processing deleting in {0} cycles.".format(pages)
-                self._log.write(msg)
-            else:
-                msg = "[{0}]: No available executions for deleting.".format(job)
-                self._log.write(msg)
+    def __clean_task(self, task, retries=5, backoff=5, unoptimized=False):
+        '''Clean a single task, which is either a whole project or one of its jobs'''
+        project, job, total = task
 
-            for page in range(0, pages):
-                executions = self.get_executions(job, page)
+        if job is None:
+            return self.clean_project_executions(project, retries, backoff, unoptimized, total)
 
-                if status:
-                    success, msg = self.__delete_executions_data(job, executions, page, retries, backoff, unoptimized)
+        return self.clean_job_executions(project, job, retries, backoff, unoptimized, total)
 
-                    if not success:
-                        return False, msg
-                else:
-                    msg = '[{0}]: Error getting executions.'.format(job)
-                    return False, msg
+    def __run_tasks(self, tasks, workers=1, retries=5, backoff=5, unoptimized=False):
+        '''Yield (task, status, data, elapsed) for each task, fanning them out to a pool of workers'''
+        if workers <= 1:
+            for task in tasks:
+                start = time()
+                status, data = self.__clean_task(task, retries, backoff, unoptimized)
+                yield task, status, data, time() - start
 
-        return True, total
+                if not status:
+                    return
+            return
+
+        failed = threading.Event()
+
+        def run(client, task):
+            '''Worker body: run a task unless another one already failed'''
+            if failed.is_set():
+                return task, None, '', 0
+
+            start = time()
+            status, data = client.__clean_task(task, retries, backoff, unoptimized)
+            if not status:
+                failed.set()
+
+            return task, status, data, time() - start
+
+        for result in self.map_clones(run, tasks, workers):
+            if result[1] is not None:
+                yield result
+
+    def resume_pending(self, unoptimized=False):
+        '''Finish the chunks an interrupted run left half-deleted, according to the journal'''
+        from mysql.connector import Error
+
+        for key, entry in self._journal.pending():
+            identifier = entry['identifier']
+            msg = '[{0}]: Resuming half-deleted chunk of {1} executions.'.format(identifier, len(entry['executions']))
+            self._log.write(msg)
+
+            # Executions still in database were not deleted through the API yet, their
+            # workflows can only go away once they do
+            try:
+                existing = self._db.get_existing_executions(entry['executions'])
+
+                if existing:
+                    status, _ = self.delete_executions(existing)
+
+                    if not status:
+                        return False, '[{0}]: Error deleting executions of a resumed chunk.'.format(identifier)
+
+                self.delete_workflows(entry['workflows'], entry['steps'], unoptimized)
+            except Error as err:
+                self._db.rollback()
+                return False, '[{0}]: Error resuming a half-deleted chunk: {1}'.format(identifier, err)
+
+            self._journal.done_pending(key)
+
+        return True, ''
+
+    def clone(self):
+        '''Return a new client with the same settings but its own HTTP session and DB connection'''
+        client = copy(self)
+        client._db = self._db.clone()
+        client._session = client.__new_session()
+
+        return client
+
+    def map_clones(self, function, items, workers):
+        '''
+        Yield function(client, item) for each item, in order, from a pool of workers where
+        each thread owns a clone of this client, closed once every item is done
+        '''
+        local = threading.local()
+        clients = []
+        lock = threading.Lock()
+
+        def run(item):
+            '''Worker body: each thread owns its HTTP session and DB connection'''
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = self.clone()
+                local.client = client
+                with lock:
+                    clients.append(client)
+
+            return function(client, item)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for result in pool.map(run, items):
+                    yield result
+        finally:
+            for client in clients:
+                client.close()
+                client._db.close()
+
+    def prescan_executions(self, project=None):
+        '''
+        Return counters of old executions by project and job, in one grouped query to
+        the database, with projects sorted from the one with most executions to delete
+        '''
+        from mysql.connector import Error
+
+        try:
+            counters = self._db.count_old_executions(get_cutoff_date(self._keep_time))
+        except Error as err:
+            return False, 'Error counting old executions: {0}'.format(err)
 
-    def clean_executions(self, project=None, project_order=True, retries=5, backoff=5, unoptimized=False):
-        '''Clean all executions data older than a given time'''
-        stats_total = 0
-        project_filter = True if project else False
+        if project:
+            counters = dict((proj, jobs) for proj, jobs in counters.items() if proj == project)
 
-        if project_filter:
-            projects = project
+        totals = sorted(((sum(jobs.values()), proj) for proj, jobs in counters.items()), reverse=True)
+        msg = 'Pre-scan: {0} old executions in {1} projects.'.format(sum(row[0] for row in totals), len(totals))
+        self._log.write(msg)
+
+        return True, OrderedDict((proj, counters[proj]) for _, proj in totals)
+
+    def clean_executions(self, project=None, project_order=True, retries=5, backoff=5, unoptimized=False, workers=1,
+                         prescan=False):
+        '''
+        Clean all executions data older than a given time. With prescan, counters of old
+        executions are taken from the database, so projects and jobs without any are not
+        visited at all, and the largest ones are cleaned first
+        '''
+        stats = OrderedDict()
+        tasks = []
+        failed = set()
+        error = ''
+        counters = None
+
+        if prescan:
+            status, counters = self.prescan_executions(project)
+            projects = list(counters) if status else counters
+        elif project:
+            status, projects = True, [project]
         else:
             status, projects = self.get_projects()
 
         if not status:
             return status, projects
 
+        if self._journal:
+            status, msg = self.resume_pending(unoptimized)
+
+            if not status:
+                self._log.write(msg, 4)
+                return False, msg
+
         for proj in projects:
-            if not project_filter or proj == project:
-                if project_order:
-                    status, data = self.clean_project_executions(proj, retries, backoff, unoptimized)
-                else:
-                    status, jobs = self.get_jobs_by_project(project)
-                    
-                    if status:
-                        for job in jobs:
-                            status, data = self.clean_job_executions(job, retries, backoff, unoptimized)
+            stats[proj] = 0
+
+            if project_order:
+                tasks.append((proj, None, sum(counters[proj].values()) if counters else None))
+            elif counters:
+                # Ad hoc executions don't belong to any job, so job order never cleans them
+                jobs = sorted(((total, job) for job, total in counters[proj].items() if job), reverse=True)
+                tasks.extend([(proj, job, total) for total, job in jobs])
+            elif not (self._journal and self._journal.is_completed(proj)):
+                status, jobs = self.get_jobs_by_project(proj)
 
                 if not status:
-                    self._log.write(data, 4)
-                    return False
-                else:
-                    msg = '[{0}] statistics: {1} old executions deleted.'.format(proj, int(data))
-                    self._log.write(msg)
-                    stats_total += int(data)
+                    self._log.write(jobs, 4)
+                    return False, jobs
+
+                tasks.extend([(proj, job, None) for job in jobs])
+
+        if self._journal:
+            tasks = [task for task in tasks if not self._journal.is_completed(task[1] if task[1] else task[0])]
+
+        remaining = Counter([task[0] for task in tasks])
+
+        for task, status, data, elapsed in self.__run_tasks(tasks, workers, retries, backoff, unoptimized):
+            if not status:
+                self._log.write(data, 4)
+                error = error or data
+                failed.add(task[0])
+                continue
+
+            identifier = task[1] if task[1] else task[0]
+            msg = '[{0}] statistics: {1} old executions deleted in {2:.1f}s ({3:.1f} executions/sec).'.format(
+                identifier, int(data), elapsed, int(data) / max(elapsed, 1e-3))
+            self._log.write(msg)
+            stats[task[0]] += int(data)
+            remaining[task[0]] -= 1
+
+            if self._journal:
+                self._journal.complete(identifier)
 
-        msg = 'Global statistics: {0} old executions deleted.'.format(stats_total)
+        if not project_order:
+            for proj, total in stats.items():
+                msg = '[{0}] statistics: {1} old executions deleted.'.format(proj, total)
+                self._log.write(msg)
+
+                if self._journal and proj not in failed and not remaining[proj]:
+                    self._journal.complete(proj)
+
+        msg = 'Global statistics: {0} old executions deleted.'.format(sum(stats.values()))
+        self._log.write(msg)
+        self._log.write(self._chunker.summary())
+
+        if error:
+            # Tasks may have failed on projects or jobs which no longer exist
+            if self._catalog:
+                self._catalog.invalidate()
+            return False, error
+
+        if self._journal:
+            self._journal.clear()
+
+        return True, ''
+
+    def export_executions(self, writer, project=None, job=None):
+        '''Export the full history of executions by job/project'''
+        status = True
+
+        if job:
+            status, data = self.get_job_project(job)
+            rows = [(data, job)]
+        elif project:
+            rows = [(project, None)]
+        else:
+            status, data = self.get_projects()
+            rows = [(proj, None) for proj in data] if status else []
+
+        if not status:
+            return False, data
+
+        start = time()
+
+        for proj, job_id in rows:
+            try:
+                for execution in self.iter_all_executions(proj, job_id):
+                    writer.write(execution)
+            except (IOError, ValueError, exceptions.RequestException) as exception:
+                err_msg = '[{0}] Error exporting executions: {1}'.format(proj, exception)
+                return False, err_msg
+
+            msg = '[{0}]: Exported executions so far: {1}.'.format(proj, writer.count)
+            self._log.write(msg, 1)
+
+        msg = 'Export statistics: {0} executions exported ({1:.1f} executions/sec).'.format(
+            writer.count, writer.count / max(time() - start, 1e-3))
         self._log.write(msg)
 
         return True, ''
@@ -431,28 +1013,29 @@ class RundeckApi(object):
 
         if not filter_job:
             if project:
-                data = project
+                data = [project]
             else:
                 status, data = self.get_projects()
         else:
-            data = job
+            data = [job]
 
         if not status:
             return False, data
 
         for row in data:
-            status, executions = self.get_executions(row, 0, False, False, only_running)
+            status, executions = self.iter_executions(row, filter_job, False, only_running)
 
             if not status:
                 err_msg = '[{0}] Error getting executions.'.format(row)
                 return False, err_msg
 
-            for ex in executions:
-                if filter_job and ex['job']['name'] == job:
-                    msg = '[{0}] - \'{1}\'  {2}'.format(ex['project'], ex['job']['name'], ex['status'])
-                    self._log.write(msg)
-                elif not filter_job:
-                    msg = '[{0}] - \'{1}\' is {2}'.format(ex['project'], ex['job']['name'], ex['status'])
+            try:
+                for ex in executions:
+                    job_name = ex['job']['name'] if 'job' in ex else ''
+                    msg = '[{0}] - \'{1}\' is {2}'.format(ex['project'], job_name, ex['status'])
                     self._log.write(msg)
+            except (ValueError, exceptions.RequestException) as exception:
+                err_msg = '[{0}] Error reading executions: {1}'.format(row, exception)
+                return False, err_msg
 
         return True, ''
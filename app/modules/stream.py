@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+from codecs import getincrementaldecoder
+from json import JSONDecoder
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonStream(object):
+    '''
+    This class decodes JSON values one at a time from a stream of byte chunks, only
+    keeping in memory the part of the document which was not consumed yet.
+    '''
+
+    def __init__(self, chunks):
+        '''Initialization of global variables'''
+        self._chunks = iter(chunks)
+        self._decoder = JSONDecoder()
+        self._text = getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._eof = False
+
+    def __more(self):
+        '''Append the next chunk of the stream to the buffer'''
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer += self._text.decode(chunk)
+                return True
+
+        self._buffer += self._text.decode(b'', final=True)
+        self._eof = True
+
+        return False
+
+    def peek(self):
+        '''Return the next non-whitespace character, without consuming it'''
+        while True:
+            stripped = self._buffer.lstrip(WHITESPACE)
+
+            if stripped:
+                self._buffer = stripped
+                return stripped[0]
+            elif not self.__more():
+                raise ValueError('Unexpected end of JSON stream.')
+
+    def expect(self, character):
+        '''Consume the next non-whitespace character, which must be the given one'''
+        if self.peek() != character:
+            raise ValueError('Expected \'{0}\' in JSON stream.'.format(character))
+
+        self._buffer = self._buffer[1:]
+
+    def value(self):
+        '''Consume and return the next JSON value'''
+        self.peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer)
+
+                # A number at the end of the buffer may still have digits to come
+                if end < len(self._buffer) or self._eof or not self.__more():
+                    self._buffer = self._buffer[end:]
+                    return value
+            except ValueError:
+                # Value is not complete yet, so wait for as much data as is buffered before
+                # decoding it again, which keeps large values from being decoded over and over
+                size = len(self._buffer)
+
+                while len(self._buffer) < 2 * size:
+                    if not self.__more():
+                        break
+
+                if self._eof and len(self._buffer) == size:
+                    raise
+
+
+def iter_json_items(chunks, key, appender=''):
+    '''Yield items of the array under a top-level key of a JSON object, as soon as they arrive'''
+    stream = JsonStream(chunks)
+    stream.expect('{')
+
+    while stream.peek() != '}':
+        if stream.peek() == ',':
+            stream.expect(',')
+
+        name = stream.value()
+        stream.expect(':')
+
+        if name != key:
+            stream.value()
+            continue
+
+        stream.expect('[')
+
+        while stream.peek() != ']':
+            if stream.peek() == ',':
+                stream.expect(',')
+
+            item = stream.value()
+            yield item[appender] if appender else item
+
+        return
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+import threading
+
+from time import sleep, time
+from mysql.connector import Error
+
+# Weight of the newest sample in API latency and error rate moving averages
+EWMA_ALPHA = 0.3
+# Pause between chunks when a signal first crosses its threshold, doubled while it stays above
+BASE_PAUSE = 1.0
+
+
+class LoadThrottle(object):
+    '''
+    This class paces chunk deletions according to the health of Rundeck and of its
+    database, so a cleanup can run alongside production traffic.
+
+    Before each chunk, it compares every signal to its threshold (0 disables it):
+    threads running and InnoDB history list length of the database, lag of a replica,
+    and moving averages of Rundeck API delete latency and error rate. Database signals
+    are sampled at most every sample_interval seconds, from connections of their own.
+
+    While any signal is above its threshold, deletion is paused, for twice as long
+    each time it is found still busy (up to max_pause). Once below, chunks keep a
+    pause between them, which is halved every time all signals are below half of
+    their thresholds, until deletion is back to full speed.
+    '''
+
+    def __init__(self, db_conn, log, replica_conn=None, max_threads_running=32, max_history_length=500000,
+                 max_replica_lag=30, max_api_latency=30.0, max_error_rate=0.2, sample_interval=5, max_pause=300,
+                 metrics=None):
+        '''Initialization of global variables'''
+        self._db = db_conn
+        self._replica = replica_conn
+        self._log = log
+        self._limits = {
+            'threads_running': max_threads_running,
+            'history_length': max_history_length,
+            'replica_lag': max_replica_lag if replica_conn else 0,
+            'api_latency': max_api_latency,
+            'error_rate': max_error_rate
+        }
+        self._sample_interval = sample_interval
+        self._max_pause = max_pause
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._signals = dict((name, 0) for name in self._limits)
+        self._sampled = 0
+        self._api_samples = 0
+        self._delay = 0.0
+
+    def observe(self, latency, success=True):
+        '''Account the latency and result of a Rundeck API delete request'''
+        with self._lock:
+            if not self._api_samples:
+                self._signals['api_latency'] = latency
+                self._signals['error_rate'] = 0.0 if success else 1.0
+            else:
+                self._signals['api_latency'] += EWMA_ALPHA * (latency - self._signals['api_latency'])
+                self._signals['error_rate'] += EWMA_ALPHA * ((0.0 if success else 1.0) - self._signals['error_rate'])
+
+            self._api_samples += 1
+
+    def __sample(self, force=False):
+        '''Refresh database signals, unless they were sampled recently'''
+        if not force and time() - self._sampled < self._sample_interval:
+            return
+
+        self._sampled = time()
+
+        try:
+            if self._limits['threads_running'] or self._limits['history_length']:
+                self._signals['threads_running'], self._signals['history_length'] = self._db.get_load()
+            if self._limits['replica_lag']:
+                lag = self._replica.get_replica_lag()
+                self._signals['replica_lag'] = lag if lag is not None else 0
+        except Error as err:
+            # A failed sample is not a reason to stop deleting, previous values are kept
+            self._log.write('Error sampling database load: {0}'.format(err), 3)
+
+    def __pressure(self):
+        '''Return the highest ratio of a signal to its threshold, and the signal name'''
+        ratios = [(self._signals[name] / float(limit), name) for name, limit in self._limits.items() if limit]
+
+        return max(ratios) if ratios else (0.0, '')
+
+    def wait(self, identifier=''):
+        '''Block until it is safe to delete the next chunk'''
+        start = time()
+
+        with self._lock:
+            self.__sample()
+            pressure, signal = self.__pressure()
+
+            if pressure < 0.5:
+                self._delay = self._delay / 2 if self._delay > BASE_PAUSE / 8 else 0.0
+
+        while pressure >= 1:
+            with self._lock:
+                self._delay = min(max(self._delay * 2, BASE_PAUSE), self._max_pause)
+                delay = self._delay
+
+            msg = '[{0}]: Throttling, {1} is {2:.1f} (limit {3}). Pausing for {4:.0f} seconds.'.format(
+                identifier, signal, self._signals[signal], self._limits[signal], delay)
+            self._log.write(msg, 3)
+            sleep(delay)
+
+            with self._lock:
+                self.__sample(True)
+                # API signals are only refreshed by requests, so let them cool down while paused
+                self._signals['api_latency'] *= 1 - EWMA_ALPHA
+                self._signals['error_rate'] *= 1 - EWMA_ALPHA
+                pressure, signal = self.__pressure()
+
+        with self._lock:
+            delay = self._delay
+
+        if delay:
+            sleep(delay)
+
+        if self._metrics:
+            self._metrics.observe('throttle', time() - start, identifier)
+
+    def close(self):
+        '''Close connections used to sample the database'''
+        self._db.close()
+
+        if self._replica:
+            self._replica.close()
@@ -2,13 +2,6 @@
 
 LOCK="/tmp/.lock.rundeck"
 
-if [ ! -f ${LOCK} ]; then 
-    touch ${LOCK}
-else
-    echo "Cleanup already running..."
-    exit 0
-fi
-
 OPTS_PARAMS="" 
 
 if [[ $DEBUG = true ]]; then 
@@ -27,7 +20,32 @@ if [ ! -z $RD_PROJECT ]; then
     OPTS_PARAMS="$OPTS_PARAMS --filtered-project ${RD_PROJECT}"
 fi
 
-python3 /app/executions_management.py \
+if [[ $RESUME = true ]] && [ "${EXEC_MODE}" = cleanup ]; then
+    OPTS_PARAMS="$OPTS_PARAMS --resume"
+fi
+
+if [[ $PROBE = true ]] && [ "${EXEC_MODE}" = cleanup -o "${EXEC_MODE}" = db-purge ]; then
+    OPTS_PARAMS="$OPTS_PARAMS --probe"
+fi
+
+if [ "${EXEC_MODE}" = daemon ]; then
+    # A single long-running process, which needs no lock and gets signals directly
+    OPTS_PARAMS="$OPTS_PARAMS --daemon-interval ${DAEMON_INTERVAL} --pass-max-time ${PASS_MAX_TIME} --pass-max-rows ${PASS_MAX_ROWS}"
+    RUN="exec python3"
+else
+    # Only trust a lock whose owner is still alive, and always release it on exit
+    if [ -f ${LOCK} ] && kill -0 $(cat ${LOCK}) 2>/dev/null; then
+        echo "Cleanup already running..."
+        exit 0
+    fi
+
+    echo $$ > ${LOCK}
+    trap "rm -f ${LOCK}" EXIT
+    trap "exit 1" INT TERM
+    RUN="python3"
+fi
+
+${RUN} /app/executions_management.py \
         --auth "${RD_TOKEN}" \
         --host "${RD_HOST}" \
         --port ${RD_PORT} \
@@ -44,6 +62,4 @@ python3 /app/executions_management.py \
         --chunk-size ${CHUNK_SIZE} \
         --retries ${RETRY_TIMES} \
         --retry-delay ${RETRY_BACKOFF} \
-        ${OPTS_PARAMS}
-
-rm ${LOCK}
\ No newline at end of file
+        ${OPTS_PARAMS}
\ No newline at end of file
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+import sqlite3
+
+from datetime import datetime, timedelta
+from os import path
+from random import Random
+from sys import path as sys_path
+
+sys_path.insert(0, path.join(path.dirname(path.abspath(__file__)), '..', '..', 'app'))
+
+from modules.db import DatabaseConn  # noqa: E402
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = '''
+CREATE TABLE scheduled_execution (id INTEGER PRIMARY KEY, uuid TEXT, job_name TEXT, project TEXT,
+                                  workflow_id INTEGER);
+CREATE TABLE workflow (id INTEGER PRIMARY KEY);
+CREATE TABLE workflow_step (id INTEGER PRIMARY KEY, error_handler_id INTEGER);
+CREATE TABLE workflow_workflow_step (workflow_commands_id INTEGER, workflow_step_id INTEGER);
+CREATE TABLE execution (id INTEGER PRIMARY KEY, project TEXT, workflow_id INTEGER, scheduled_execution_id INTEGER,
+                        status TEXT, rduser TEXT, date_started TEXT, date_completed TEXT, outputfilepath TEXT,
+                        retry_execution_id INTEGER, argstring TEXT);
+CREATE TABLE base_report (id INTEGER PRIMARY KEY, jc_exec_id VARCHAR(255), ctx_project TEXT, date_completed TEXT,
+                          node TEXT, message TEXT);
+CREATE INDEX exec_idx_project ON execution (project, date_completed);
+CREATE INDEX exec_idx_workflow ON execution (workflow_id);
+CREATE INDEX wws_idx_workflow ON workflow_workflow_step (workflow_commands_id);
+CREATE INDEX wws_idx_step ON workflow_workflow_step (workflow_step_id);
+CREATE INDEX report_idx_exec ON base_report (jc_exec_id);
+'''
+
+sqlite3.register_adapter(datetime, lambda date: date.strftime(DATE_FORMAT))
+
+
+def seed(db_path, projects=4, jobs=5, executions=10000, steps=3, old_ratio=0.8, seed_value=42):
+    '''
+    Create a Rundeck-like database with executions spread over projects and jobs, each one
+    with its own workflow copy and steps, and old_ratio of them older than 30 days
+    '''
+    rnd = Random(seed_value)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    now = datetime.now()
+    job_rows = []
+    step_id = 0
+
+    for index in range(projects * jobs):
+        project = 'project-{0}'.format(index // jobs)
+        uuid = '{0:08x}-0000-4000-8000-{1:012x}'.format(rnd.getrandbits(32), index)
+        job_rows.append((index + 1, uuid, 'job-{0}'.format(index), project, None))
+
+    conn.executemany('INSERT INTO scheduled_execution VALUES (?, ?, ?, ?, ?)', job_rows)
+
+    workflows, step_rows, links, execution_rows, reports = [], [], [], [], []
+
+    for exec_id in range(1, executions + 1):
+        job = job_rows[rnd.randrange(len(job_rows))]
+        age = rnd.uniform(31, 400) if rnd.random() < old_ratio else rnd.uniform(0, 29)
+        started = now - timedelta(days=age)
+        completed = started + timedelta(seconds=rnd.randint(1, 600))
+        workflows.append((exec_id,))
+
+        for _ in range(steps):
+            step_id += 1
+            step_rows.append((step_id, None))
+            links.append((exec_id, step_id))
+
+        execution_rows.append((exec_id, job[3], exec_id, job[0], 'succeeded', 'admin',
+                               started, completed,
+                               '/var/lib/rundeck/logs/rundeck/{0}/job/{1}/logs/{2}.rdlog'.format(job[3], job[1], exec_id),
+                               None, '-env bench'))
+        reports.append((exec_id, str(exec_id), job[3], completed, '1/0/1', 'Job status succeeded'))
+
+    conn.executemany('INSERT INTO workflow VALUES (?)', workflows)
+    conn.executemany('INSERT INTO workflow_step VALUES (?, ?)', step_rows)
+    conn.executemany('INSERT INTO workflow_workflow_step VALUES (?, ?)', links)
+    conn.executemany('INSERT INTO execution VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', execution_rows)
+    conn.executemany('INSERT INTO base_report VALUES (?, ?, ?, ?, ?, ?)', reports)
+    conn.commit()
+    conn.close()
+
+
+class FixtureDatabase(DatabaseConn):
+    '''
+    DatabaseConn over a SQLite file seeded by seed(), so cleanup runs offline. Only
+    the MySQL-specific bits (connection and parameters markers) are replaced, every
+    query still goes through DatabaseConn methods.
+    '''
+
+    def __init__(self, db_path):
+        '''Initialization of global variables'''
+        self._db_path = db_path
+        super(FixtureDatabase, self).__init__(db_path, None, None)
+        self.open()
+
+    def open(self):
+        '''Open a new connection session to database'''
+        self._connection = sqlite3.connect(self._db_path, timeout=60, check_same_thread=False)
+        self._session = self._connection.cursor()
+
+    def is_alive(self):
+        '''SQLite connections never drop'''
+        return bool(self._connection)
+
+    def clone(self):
+        '''Return a new object with the same settings but its own connection'''
+        return FixtureDatabase(self._db_path)
+
+    def close(self):
+        '''Close both session and connection to database'''
+        if self._connection:
+            self._connection.close()
+        self._connection = None
+
+    def query(self, query, parameters=None):
+        '''Return results from a given query'''
+        if parameters is None:
+            return self._session.execute(query)
+
+        return self._session.execute(query.replace('%s', '?'), tuple(parameters))
+
+    def apply(self):
+        '''Commit changes in database'''
+        self._connection.commit()
+
+    def rollback(self):
+        '''Discard uncommitted changes in database'''
+        self._connection.rollback()
+
+    def count(self, stmt, parameters=()):
+        '''Return the single value of a counting query'''
+        return self._session.execute(stmt, parameters).fetchone()[0]
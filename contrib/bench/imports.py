@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+import argparse
+
+from json import dumps, loads
+from os import path
+from subprocess import PIPE, run
+from sys import executable
+
+APP_DIR = path.join(path.dirname(path.abspath(__file__)), '..', '..', 'app')
+
+# Modules imported by each scheduled run before it knows its mode, and packages
+# which must only be imported by the modes which need them
+STARTUP = 'executions_management'
+TARGETS = (STARTUP, 'modules.db', 'modules.rundeck', 'modules.purge', 'modules.async_rundeck')
+HEAVY = ('requests', 'urllib3', 'mysql', 'aiohttp')
+ALLOWED = {
+    'modules.rundeck': ('requests', 'urllib3'),
+    'modules.purge': ('mysql',),
+    'modules.async_rundeck': ('aiohttp',)
+}
+
+PROBE = '''
+import sys
+from json import dumps
+from time import perf_counter
+
+start = perf_counter()
+try:
+    __import__({0!r})
+    error = None
+except ImportError as err:
+    error = str(err)
+
+print(dumps({{'seconds': perf_counter() - start, 'error': error,
+             'heavy': sorted(set(name.split('.')[0] for name in sys.modules) & set({1!r}))}}))
+'''
+
+
+def parse_args():
+    '''Parse benchmark parameters'''
+    parser = argparse.ArgumentParser(description='Benchmark how long a fresh interpreter takes to import the '
+                                                 'entry point and the main modules, and which heavy packages '
+                                                 'each of them pulls in.')
+    parser.add_argument('--runs', help='Fresh interpreters started by module', type=int, default=10)
+    parser.add_argument('--modules', help='Comma separated modules to benchmark', type=str,
+                        default=','.join(TARGETS))
+    parser.add_argument('--max-startup', help='Fail when importing the entry point takes longer (milliseconds), '
+                                              '0 disables it', type=float, default=0)
+    parser.add_argument('--json', help='Print results as JSON lines instead of a table', action='store_true')
+
+    return parser.parse_args()
+
+
+def measure(module, runs):
+    '''Import a module in fresh interpreters, returning its median import time and what it loaded'''
+    samples = []
+    result = {}
+
+    for _ in range(runs):
+        output = run([executable, '-c', PROBE.format(module, HEAVY)], cwd=APP_DIR, stdout=PIPE, check=True)
+        result = loads(output.stdout.decode('utf-8'))
+        samples.append(result['seconds'])
+
+    samples.sort()
+    unexpected = [name for name in result['heavy'] if name not in ALLOWED.get(module, ())]
+
+    return {
+        'module': module,
+        'median_ms': round(samples[len(samples) // 2] * 1000, 1),
+        'min_ms': round(samples[0] * 1000, 1),
+        'heavy': ','.join(result['heavy']) or '-',
+        'error': result['error'],
+        'success': not unexpected and not result['error']
+    }
+
+
+if __name__ == '__main__':
+    CONF = parse_args()
+    COLUMNS = ('module', 'median_ms', 'min_ms', 'heavy', 'success')
+
+    if not CONF.json:
+        print(' '.join('{0:>22}'.format(column) for column in COLUMNS))
+
+    FAILED = False
+
+    for MODULE in CONF.modules.split(','):
+        RESULT = measure(MODULE, CONF.runs)
+
+        if MODULE == STARTUP and CONF.max_startup and RESULT['median_ms'] > CONF.max_startup:
+            RESULT['success'] = False
+
+        FAILED = FAILED or not RESULT['success']
+
+        if CONF.json:
+            print(dumps(RESULT, sort_keys=True))
+        else:
+            print(' '.join('{0:>22}'.format(str(RESULT[column])) for column in COLUMNS))
+            if RESULT['error']:
+                print('{0:>22} {1}'.format('', RESULT['error']))
+
+    exit(1 if FAILED else 0)
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+
+import argparse
+
+from json import dumps
+from os import devnull, path
+from shutil import copyfile
+from tempfile import mkdtemp
+from time import time
+
+from fixture import FixtureDatabase, seed
+from stub import RundeckStub
+
+from modules.adaptive import ChunkController
+from modules.archive import ExecutionsArchive
+from modules.base import get_cutoff_date
+from modules.export import ExecutionsWriter
+from modules.logger import Logger
+from modules.metrics import Metrics
+from modules.rundeck import RundeckApi
+
+HEADERS = {
+    'X-Rundeck-Auth-Token': 'benchmark',
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+}
+
+
+def parse_args():
+    '''Parse benchmark parameters'''
+    parser = argparse.ArgumentParser(description='Benchmark executions cleanup and listing against a local '
+                                                 'Rundeck API stub and a seeded SQLite database.')
+    parser.add_argument('--projects', help='Projects to seed', type=int, default=4)
+    parser.add_argument('--jobs', help='Jobs to seed by project', type=int, default=5)
+    parser.add_argument('--executions', help='Executions to seed', type=int, default=10000)
+    parser.add_argument('--steps', help='Workflow steps by execution', type=int, default=3)
+    parser.add_argument('--old-ratio', help='Ratio of executions older than --keep-time', type=float, default=0.8)
+    parser.add_argument('--keep-time', help='Cleanup executions older than this time', type=str, default='30d')
+    parser.add_argument('--chunk-sizes', help='Comma separated chunk sizes to benchmark', type=str,
+                        default='50,200,500')
+    parser.add_argument('--workers', help='Comma separated workers counts to benchmark', type=str,
+                        default='1,4')
+    parser.add_argument('--prefetch', help='Pages prefetched while deleting', type=int, default=2)
+    parser.add_argument('--latency', help='Seconds added to every API request', type=float, default=0.005)
+    parser.add_argument('--delete-cost', help='Seconds added per deleted execution', type=float, default=0.0002)
+    parser.add_argument('--failure-rate', help='Ratio of API requests failing with HTTP 503', type=float,
+                        default=0.0)
+    parser.add_argument('--partial-rate', help='Ratio of executions failing to be deleted', type=float,
+                        default=0.0)
+    parser.add_argument('--seed', help='Random seed of fixture and failures', type=int, default=42)
+    parser.add_argument('--modes', help='Comma separated modes to benchmark (cleanup, export)', type=str,
+                        default='cleanup,export')
+    parser.add_argument('--archive', help='Archive executions before deleting them in cleanup runs',
+                        action='store_true')
+    parser.add_argument('--async-client', help='Clean up with asyncio-based client, with as many concurrent '
+                                               'requests as workers', action='store_true')
+    parser.add_argument('--json', help='Print results as JSON lines instead of a table', action='store_true')
+    parser.add_argument('--debug', help='Print cleanup logs', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.archive and args.async_client:
+        parser.error('--archive is not supported by --async-client')
+
+    return args
+
+
+class Benchmark(object):
+    '''
+    This class runs every mode over a matrix of chunk sizes and workers counts. Each
+    run works on a fresh copy of the same seeded database, behind its own API stub, so
+    results can be compared across runs and across changes of the code.
+    '''
+
+    def __init__(self, conf):
+        '''Initialization of global variables'''
+        self._conf = conf
+        self._dir = mkdtemp(prefix='rundeck-bench-')
+        self._template = path.join(self._dir, 'template.db')
+        self._log = Logger(level=1 if conf.debug else 5)
+
+    def __client(self, chunk_size, metrics, archive=None):
+        '''Return a stub serving a copy of the fixture, and an API client pointed to it'''
+        run_path = path.join(self._dir, 'run-{0}.db'.format(int(time() * 1000)))
+        copyfile(self._template, run_path)
+
+        stub = RundeckStub(run_path, self._conf.latency, self._conf.delete_cost, self._conf.failure_rate,
+                           self._conf.partial_rate, self._conf.seed).start()
+        db_conn = FixtureDatabase(run_path)
+        rdeck = RundeckApi(stub.url, HEADERS, db_conn, self._log, chunk_size, self._conf.keep_time,
+                           prefetch=self._conf.prefetch, chunker=ChunkController(chunk_size), metrics=metrics,
+                           archive=archive)
+
+        return stub, db_conn, rdeck
+
+    def cleanup(self, chunk_size, workers):
+        '''Run a full cleanup and return its results'''
+        metrics = Metrics()
+        archive = ExecutionsArchive(mkdtemp(dir=self._dir)) if self._conf.archive else None
+        stub, db_conn, rdeck = self.__client(chunk_size, metrics, archive)
+        cutoff = get_cutoff_date(self._conf.keep_time)
+        old = db_conn.count('SELECT COUNT(*) FROM execution WHERE date_completed < ?', (cutoff,))
+
+        try:
+            start = time()
+            if self._conf.async_client:
+                from modules.async_rundeck import AsyncRundeckApi
+
+                ardeck = AsyncRundeckApi(stub.url, HEADERS, db_conn, self._log, chunk_size, self._conf.keep_time,
+                                         concurrency=workers)
+                status, msg = ardeck.run('clean_executions', None, 3, 0, True)
+            else:
+                status, msg = rdeck.clean_executions(retries=3, backoff=0, unoptimized=True, workers=workers)
+            elapsed = time() - start
+        finally:
+            rdeck.close()
+            stub.stop()
+            if archive:
+                archive.close()
+
+        summary = metrics.summary()
+        deletes = summary['phases'].get('api_delete', {}).values()
+        calls = sum(phase['count'] for phase in deletes)
+        left = db_conn.count('SELECT COUNT(*) FROM execution WHERE date_completed < ?', (cutoff,))
+        orphans = db_conn.count('SELECT COUNT(*) FROM workflow w LEFT JOIN execution e ON e.workflow_id = w.id '
+                                'WHERE e.id IS NULL')
+        db_conn.close()
+        # Every deleted execution must have been archived first
+        unarchived = max(old - left - archive.count, 0) if archive else 0
+
+        return {
+            'mode': 'async-cleanup' if self._conf.async_client else 'cleanup',
+            'chunk_size': chunk_size,
+            'workers': workers,
+            'success': bool(status) and not left and not orphans and not unarchived,
+            'message': msg,
+            'executions': old - left,
+            'seconds': round(elapsed, 3),
+            'per_second': round((old - left) / elapsed, 1) if elapsed else 0,
+            'api_delete_avg': round(sum(phase['seconds'] for phase in deletes) / calls, 4) if calls else 0,
+            'requests': stub.requests,
+            'left_behind': left,
+            'orphan_workflows': orphans
+        }
+
+    def export(self, chunk_size, workers):
+        '''Export the full history of executions and return its results'''
+        metrics = Metrics()
+        stub, db_conn, rdeck = self.__client(chunk_size, metrics)
+        total = db_conn.count('SELECT COUNT(*) FROM execution')
+        writer = ExecutionsWriter(devnull)
+
+        try:
+            start = time()
+            status, msg = rdeck.export_executions(writer)
+            elapsed = time() - start
+        finally:
+            writer.close()
+            rdeck.close()
+            stub.stop()
+            db_conn.close()
+
+        return {
+            'mode': 'export',
+            'chunk_size': chunk_size,
+            'workers': workers,
+            'success': bool(status) and writer.count == total,
+            'message': msg,
+            'executions': writer.count,
+            'seconds': round(elapsed, 3),
+            'per_second': round(writer.count / elapsed, 1) if elapsed else 0,
+            'api_delete_avg': 0,
+            'requests': stub.requests,
+            'left_behind': total - writer.count,
+            'orphan_workflows': 0
+        }
+
+    def run(self):
+        '''Seed the fixture once, then yield results of every run of the matrix'''
+        conf = self._conf
+        seed(self._template, conf.projects, conf.jobs, conf.executions, conf.steps, conf.old_ratio, conf.seed)
+        chunk_sizes = [int(size) for size in conf.chunk_sizes.split(',')]
+        workers = [int(count) for count in conf.workers.split(',')]
+
+        for mode in conf.modes.split(','):
+            for chunk_size in chunk_sizes:
+                # Export does not fan out to workers, so a single run by chunk size is enough
+                for count in (workers if mode == 'cleanup' else workers[:1]):
+                    yield getattr(self, mode)(chunk_size, count)
+
+
+if __name__ == '__main__':
+    CONF = parse_args()
+    COLUMNS = ('mode', 'chunk_size', 'workers', 'executions', 'seconds', 'per_second', 'api_delete_avg',
+               'requests', 'success')
+
+    if not CONF.json:
+        print(' '.join('{0:>14}'.format(column) for column in COLUMNS))
+
+    FAILED = False
+
+    for RESULT in Benchmark(CONF).run():
+        FAILED = FAILED or not RESULT['success']
+
+        if CONF.json:
+            print(dumps(RESULT, sort_keys=True))
+        else:
+            print(' '.join('{0:>14}'.format(str(RESULT[column])) for column in COLUMNS))
+
+    exit(1 if FAILED else 0)
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+
+import sqlite3
+import threading
+
+from calendar import timegm
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps, loads
+from random import Random
+from socketserver import ThreadingMixIn
+from time import mktime, sleep, strptime
+from urllib.parse import parse_qs, urlparse
+
+from fixture import DATE_FORMAT
+from modules.base import get_cutoff_date
+
+
+def to_date(value):
+    '''Return Rundeck representation of a date stored in the fixture'''
+    unixtime = int(mktime(datetime.strptime(value, DATE_FORMAT).timetuple()))
+    date = datetime.utcfromtimestamp(unixtime).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    return {'unixtime': unixtime * 1000, 'date': date}
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    '''HTTP server answering each request in its own thread'''
+    daemon_threads = True
+
+
+class RundeckStub(object):
+    '''
+    Local HTTP server implementing the subset of Rundeck API used by this tool, on top
+    of a fixture database, with configurable latency and failure injection:
+
+    - latency: seconds added to every request,
+    - delete_cost: seconds added per execution deleted,
+    - failure_rate: probability of a request failing with HTTP 503,
+    - partial_rate: probability of each execution failing to be deleted.
+    '''
+
+    def __init__(self, db_path, latency=0.0, delete_cost=0.0, failure_rate=0.0, partial_rate=0.0, seed_value=42):
+        '''Initialization of global variables'''
+        self.db_path = db_path
+        self.latency = latency
+        self.delete_cost = delete_cost
+        self.failure_rate = failure_rate
+        self.partial_rate = partial_rate
+        self.random = Random(seed_value)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._server = ThreadingServer(('127.0.0.1', 0), self.__handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        '''Base URL of the API, as built by executions_management.py'''
+        return 'http://127.0.0.1:{0}/api/19'.format(self._server.server_address[1])
+
+    def start(self):
+        '''Serve requests in a background thread'''
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        '''Stop serving requests'''
+        self._server.shutdown()
+        self._server.server_close()
+
+    def chance(self, rate):
+        '''Return True with a given probability'''
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def executions(self, conn, where, parameters, query):
+        '''Return a page of executions, newest first, as Rundeck does'''
+        max_rows = int(query.get('max', ['20'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+
+        if 'olderFilter' in query:
+            where.append('e.date_completed < ?')
+            parameters.append(get_cutoff_date(query['olderFilter'][0]))
+        if 'end' in query:
+            where.append('e.date_completed < ?')
+            # Dates are given in UTC while the fixture stores local dates
+            end = timegm(strptime(query['end'][0], '%Y-%m-%dT%H:%M:%SZ'))
+            parameters.append(datetime.fromtimestamp(end))
+        if 'jobIdListFilter' in query:
+            where.append('se.uuid = ?')
+            parameters.append(query['jobIdListFilter'][0])
+
+        stmt = 'FROM execution e LEFT JOIN scheduled_execution se ON se.id = e.scheduled_execution_id ' \
+               'WHERE {0}'.format(' AND '.join(where))
+        total = conn.execute('SELECT COUNT(*) ' + stmt, parameters).fetchone()[0]
+        rows = conn.execute('SELECT e.id, e.project, e.status, e.rduser, e.date_started, e.date_completed, se.uuid, '
+                            'se.job_name ' + stmt + ' ORDER BY e.date_completed DESC, e.id DESC LIMIT ? OFFSET ?',
+                            parameters + [max_rows, offset]).fetchall()
+        executions = [{
+            'id': row[0],
+            'project': row[1],
+            'status': row[2],
+            'user': row[3],
+            'date-started': to_date(row[4]),
+            'date-ended': to_date(row[5]),
+            'job': {'id': row[6], 'name': row[7]}
+        } for row in rows]
+
+        return {
+            'paging': {'count': len(executions), 'total': total, 'offset': offset, 'max': max_rows},
+            'executions': executions
+        }
+
+    def delete(self, conn, ids):
+        '''Delete executions like Rundeck does, leaving workflow tables untouched'''
+        failures = [{'id': str(exec_id), 'message': 'Failed to delete execution'}
+                    for exec_id in ids if self.chance(self.partial_rate)]
+        failed = set(int(failure['id']) for failure in failures)
+        deleted = [exec_id for exec_id in ids if exec_id not in failed]
+        marks = ','.join(['?'] * len(deleted))
+
+        if deleted:
+            conn.execute('DELETE FROM base_report WHERE jc_exec_id IN ({0})'.format(marks), deleted)
+            conn.execute('DELETE FROM execution WHERE id IN ({0})'.format(marks), deleted)
+            conn.commit()
+
+        sleep(self.delete_cost * len(ids))
+
+        return {
+            'requestCount': len(ids),
+            'successCount': len(deleted),
+            'failedCount': len(failures),
+            'allsuccessful': not failures,
+            'failures': failures
+        }
+
+    def route(self, method, url, body):
+        '''Return status and JSON body answering a request'''
+        parts = [part for part in url.path.split('/') if part][2:]
+        query = parse_qs(url.query)
+        conn = sqlite3.connect(self.db_path, timeout=60)
+
+        try:
+            if method == 'GET' and parts == ['projects']:
+                rows = conn.execute('SELECT DISTINCT project FROM scheduled_execution ORDER BY project').fetchall()
+                return 200, [{'name': row[0]} for row in rows]
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'project' and parts[2] == 'jobs':
+                rows = conn.execute('SELECT uuid, job_name FROM scheduled_execution WHERE project = ?',
+                                    (parts[1],)).fetchall()
+                return 200, [{'id': row[0], 'name': row[1], 'project': parts[1]} for row in rows]
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'project' and parts[2] == 'executions':
+                return 200, self.executions(conn, ['e.project = ?'], [parts[1]], query)
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'job' and parts[2] == 'executions':
+                return 200, self.executions(conn, ['se.uuid = ?'], [parts[1]], query)
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'job' and parts[2] == 'info':
+                row = conn.execute('SELECT uuid, job_name, project FROM scheduled_execution WHERE uuid = ?',
+                                   (parts[1],)).fetchone()
+                if not row:
+                    return 404, {'error': True}
+                return 200, {'id': row[0], 'name': row[1], 'project': row[2]}
+            elif method == 'POST' and parts == ['executions', 'delete']:
+                return 200, self.delete(conn, [int(exec_id) for exec_id in loads(body)])
+
+            return 404, {'error': True, 'message': 'Not implemented by stub.'}
+        finally:
+            conn.close()
+
+    def __handler(self):
+        '''Return the request handler class bound to this stub'''
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            '''Answer Rundeck API requests from the fixture database'''
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                '''Keep benchmark output clean'''
+                pass
+
+            def answer(self, method):
+                '''Common handling of GET and POST requests'''
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+
+                with stub.lock:
+                    stub.requests += 1
+
+                sleep(stub.latency)
+
+                if stub.chance(stub.failure_rate):
+                    status, data = 503, {'error': True, 'message': 'Injected failure.'}
+                else:
+                    status, data = stub.route(method, urlparse(self.path), body)
+
+                payload = dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                '''GET requests'''
+                self.answer('GET')
+
+            def do_POST(self):
+                '''POST requests'''
+                self.answer('POST')
+
+        return Handler
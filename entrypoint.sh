@@ -2,7 +2,7 @@
 
 scheduled_time=${SCHEDULE:-"* 0 * * *"}
 
-if [ ${ONETIME_RUNNING} = true ]; then
+if [ ${ONETIME_RUNNING} = true ] || [ "${EXEC_MODE}" = daemon ]; then
     mode="/app/run.sh"
 else
     echo -n "${scheduled_time}       /bin/bash /app/run.sh >> 2>&1 | tee /var/log/rundeck_cleanup.log" | crontab -